@@ -0,0 +1,130 @@
+"""
+Inside PC — проверка пользователя Mini App.
+
+initData от Telegram проверяется по HMAC-SHA256 (ключ — HMAC("WebAppData",
+BOT_TOKEN)) и один раз обменивается на короткоживущий токен сессии
+"<user_id>.<истекает>.<подпись>". Токен проверяется одним HMAC без
+обращения к БД. Успешные проверки initData запоминаются в LRU: та же
+строка в заголовке повторно HMAC не пересчитывает.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+
+from fastapi import Header, HTTPException, Query
+
+
+class AuthError(Exception):
+    """initData или токен не прошли проверку."""
+
+
+def _sign(key, msg):
+    return hmac.new(key, msg.encode(), hashlib.sha256).digest()
+
+
+class Sessions:
+    def __init__(self, bot_token, secret="", ttl=3600, init_data_max_age=24 * 3600, cache_size=10000):
+        self._webapp_key = _sign(b"WebAppData", bot_token)
+        # Без отдельного секрета ключ сессий выводится из токена бота
+        self._session_key = secret.encode() if secret else _sign(b"InsidePC-session", bot_token)
+        self.ttl = ttl
+        self.init_data_max_age = init_data_max_age
+        self.cache_size = cache_size
+        self._verified = OrderedDict()  # initData -> (user, auth_date)
+        self.hmac_checks = 0
+
+    def verify_init_data(self, init_data):
+        """Профиль пользователя (dict из поля user) из подлинной и свежей initData."""
+        hit = self._verified.get(init_data)
+        if hit is None:
+            hit = self._check_init_data(init_data)
+            self._verified[init_data] = hit
+            if len(self._verified) > self.cache_size:
+                self._verified.popitem(last=False)
+        else:
+            self._verified.move_to_end(init_data)
+        user, auth_date = hit
+        if time.time() - auth_date > self.init_data_max_age:
+            raise AuthError("initData устарела")
+        return user
+
+    def _check_init_data(self, init_data):
+        self.hmac_checks += 1
+        fields = dict(parse_qsl(init_data, keep_blank_values=True))
+        received = fields.pop("hash", "")
+        check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+        expected = hmac.new(self._webapp_key, check_string.encode(), hashlib.sha256).hexdigest()
+        # compare_digest на str падает с TypeError при не-ASCII символах
+        if not received.isascii() or not hmac.compare_digest(expected, received):
+            raise AuthError("неверная подпись initData")
+        try:
+            user = json.loads(fields["user"])
+            auth_date = int(fields["auth_date"])
+            int(user["id"])
+        except (KeyError, TypeError, ValueError):
+            raise AuthError("в initData нет пользователя")
+        return user, auth_date
+
+    def issue(self, user_id):
+        """(токен, unix-время истечения)."""
+        expires = int(time.time()) + self.ttl
+        payload = f"{int(user_id)}.{expires}"
+        sig = base64.urlsafe_b64encode(_sign(self._session_key, payload)[:18]).decode()
+        return f"{payload}.{sig}", expires
+
+    def check(self, token):
+        """user_id из токена сессии."""
+        # Только ASCII: иначе compare_digest и int() (isdigit() пропускает "²") бросают не AuthError
+        if not token.isascii():
+            raise AuthError("неверный токен")
+        payload, _, sig = token.rpartition(".")
+        uid, _, expires = payload.partition(".")
+        expected = base64.urlsafe_b64encode(_sign(self._session_key, payload)[:18]).decode()
+        if not (uid.isdigit() and expires.isdigit()) or not hmac.compare_digest(expected, sig):
+            raise AuthError("неверный токен")
+        if int(expires) < time.time():
+            raise AuthError("токен истёк")
+        return int(uid)
+
+    def user_id(self, authorization=None, init_data=None, access_token=None):
+        """
+        user_id из "Authorization: Bearer <токен>", ?access_token= (для EventSource
+        и WebSocket, которым не задать заголовки) или X-Telegram-Init-Data.
+        """
+        if authorization and authorization.lower().startswith("bearer "):
+            return self.check(authorization[7:].strip())
+        if access_token:
+            return self.check(access_token)
+        if init_data:
+            return int(self.verify_init_data(init_data)["id"])
+        raise AuthError("нужна авторизация")
+
+    def scope_user(self, scope):
+        """user_id проверенной сессии из ASGI scope или None — для ratelimit."""
+        headers = dict(scope.get("headers", ()))
+        query = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        try:
+            return self.user_id(headers.get(b"authorization", b"").decode("latin-1"),
+                                headers.get(b"x-telegram-init-data", b"").decode("latin-1"),
+                                query.get("access_token"))
+        except AuthError:
+            return None
+
+    def stats(self):
+        return {"init_data_cache": len(self._verified), "hmac_checks": self.hmac_checks}
+
+
+def user_dependency(sessions):
+    """FastAPI-зависимость: user_id текущего пользователя или 401."""
+    async def require_user(authorization: str | None = Header(None),
+                           init_data: str | None = Header(None, alias="X-Telegram-Init-Data"),
+                           access_token: str | None = Query(None)) -> int:
+        try:
+            return sessions.user_id(authorization, init_data, access_token)
+        except AuthError as e:
+            raise HTTPException(401, str(e), headers={"WWW-Authenticate": "Bearer"})
+    return require_user
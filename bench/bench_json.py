@@ -0,0 +1,138 @@
+"""
+Бенчмарк: сериализация ответов API по эндпоинтам на 1k / 10k / 100k строк.
+
+Варианты:
+  encoder+json   — путь FastAPI по умолчанию: jsonable_encoder + stdlib json
+  response_model — то же плюс валидация/дамп pydantic-модели ответа
+  json           — stdlib json.dumps готовых dict
+  fastjson       — fastjson.dumps (orjson, если установлен)
+
+    python bench/bench_json.py [--rows 1000 10000 100000] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fastjson  # noqa: E402
+
+try:
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import BaseModel
+except ImportError:
+    jsonable_encoder = BaseModel = None
+
+STATUSES = ("pending_payment", "payment_uploaded", "payment_confirmed", "in_progress", "completed")
+
+
+def order_items(n):
+    """Строки /api/orders/{user_id} в том виде, в каком их отдаёт _order_item."""
+    return {"items": [{
+        "id": i, "service": "Сборка ПК", "status": STATUSES[i % 5], "status_text": "В работе",
+        "price_byn": 100.0, "price_rub": 2800.0, "price_prefix": "",
+        "date": "2026-01-01 12:00",
+    } for i in range(n)], "next_cursor": n, "counts": {s: n // 5 for s in STATUSES}}
+
+
+def portfolio_items(n):
+    """Элементы ленты /api/portfolio (как _build_portfolio_feed)."""
+    photos = [f"AgACAgIAAxkBAAI{i:06d}" for i in range(3)]
+    return [{
+        "id": i, "title": f"Сборка #{i}", "description": "Тихая сборка для работы и игр",
+        "specs": "Ryzen 7 / RTX 4070 / 32 GB", "price_byn": 4200.0, "price_rub": 118000.0,
+        "category": "gaming", "photos": photos, "photo_count": 3,
+        "images": [{"src": f"/media/{f}/1280", "srcset": f"/media/{f}/320 320w, /media/{f}/640 640w"} for f in photos],
+        "date": "2026-01-01 12:00",
+    } for i in range(n)]
+
+
+def stdlib_dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def models():
+    if BaseModel is None:
+        return {}
+
+    class OrderItemOut(BaseModel):
+        id: int
+        service: str
+        status: str
+        status_text: str
+        price_byn: float | None
+        price_rub: float | None
+        price_prefix: str
+        date: str
+
+    class OrdersPageOut(BaseModel):
+        items: list[OrderItemOut]
+        next_cursor: int | None
+        counts: dict[str, int] | None = None
+
+    class ImageOut(BaseModel):
+        src: str
+        srcset: str
+
+    class PortfolioItemOut(BaseModel):
+        id: int
+        title: str
+        description: str
+        specs: str
+        price_byn: float
+        price_rub: float
+        category: str
+        photos: list[str]
+        photo_count: int
+        images: list[ImageOut]
+        date: str
+
+    return {"orders": OrdersPageOut, "portfolio": list[PortfolioItemOut]}
+
+
+def variants(model):
+    out = {}
+    if jsonable_encoder is not None:
+        out["encoder+json"] = lambda d: stdlib_dumps(jsonable_encoder(d))
+    if model is not None:
+        from pydantic import TypeAdapter
+        adapter = TypeAdapter(model)
+        out["response_model"] = lambda d: stdlib_dumps(jsonable_encoder(adapter.dump_python(adapter.validate_python(d))))
+    out["json"] = stdlib_dumps
+    out["fastjson"] = fastjson.dumps
+    return out
+
+
+def measure(fn, data, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        body = fn(data)
+        best = min(best, time.perf_counter() - t)
+    return best, len(body)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    schemas = models()
+    print(f"orjson: {'да' if fastjson.orjson is not None else 'нет (stdlib json)'}")
+    print(f"{'endpoint':<12}{'rows':>8}  {'variant':<16}{'ms':>10}{'KiB':>10}{'x json':>9}")
+    for endpoint, build in (("orders", order_items), ("portfolio", portfolio_items)):
+        for n in args.rows:
+            data = build(n)
+            results = {name: measure(fn, data, args.repeat)
+                       for name, fn in variants(schemas.get(endpoint)).items()}
+            base = results["json"][0]
+            for name, (elapsed, size) in results.items():
+                print(f"{endpoint:<12}{n:>8}  {name:<16}{elapsed * 1000:>10.1f}{size / 1024:>10.0f}"
+                      f"{base / elapsed:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
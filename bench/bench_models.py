@@ -0,0 +1,79 @@
+"""
+Бенчмарк: строки заказов как dict(row) против слотовой модели Order(*row).
+Память удерживаемых строк (tracemalloc) и время материализации.
+
+    python bench/bench_models.py [--rows 100000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Order  # noqa: E402
+
+SCHEMA = """
+    CREATE TABLE orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        service_type TEXT NOT NULL,
+        has_parts INTEGER DEFAULT 0,
+        parts_data TEXT,
+        description TEXT,
+        status TEXT DEFAULT 'pending_payment',
+        payment_photo TEXT,
+        topic_id INTEGER,
+        price_byn REAL,
+        price_rub REAL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def fill(db, n):
+    db.execute(SCHEMA)
+    db.executemany(
+        "INSERT INTO orders (user_id, service_type, has_parts, parts_data, description, price_byn, price_rub) "
+        "VALUES (?,?,?,?,?,?,?)",
+        ((i % 500, "build", i % 2, '{"cpu": "Ryzen 5"}' if i % 2 else None, "тест", 100.0, 2800.0)
+         for i in range(n)),
+    )
+    db.commit()
+
+
+def measure(db, build):
+    rows = db.execute(f"SELECT {Order.COLUMNS} FROM orders").fetchall()
+    tracemalloc.start()
+    t = time.perf_counter()
+    objs = [build(r) for r in rows]
+    elapsed = time.perf_counter() - t
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    t = time.perf_counter()
+    for o in objs:
+        o["status"], o["price_byn"]
+    access = time.perf_counter() - t
+    return elapsed, access, size
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000)
+    args = ap.parse_args()
+
+    db = sqlite3.connect(":memory:")
+    db.row_factory = sqlite3.Row
+    fill(db, args.rows)
+
+    print(f"{'variant':<12}{'build ms':>12}{'access ms':>12}{'MiB':>10}{'B/row':>10}")
+    for name, build in (("dict(row)", dict), ("Order(*row)", lambda r: Order(*r))):
+        elapsed, access, size = measure(db, build)
+        print(f"{name:<12}{elapsed * 1000:>12.1f}{access * 1000:>12.1f}"
+              f"{size / 2**20:>10.1f}{size / args.rows:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
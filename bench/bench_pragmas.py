@@ -0,0 +1,80 @@
+"""
+Бенчмарк: запись и чтение заказов с профилем PRAGMA из config и без него.
+
+    python bench/bench_pragmas.py [--writes 2000] [--reads 20000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from db_pool import Pool  # noqa: E402
+
+SCHEMA = """
+    CREATE TABLE orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        service_type TEXT NOT NULL,
+        status TEXT DEFAULT 'pending_payment',
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+async def run(pragmas, writes, reads, concurrency):
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = Pool(os.path.join(tmp, "bench.db"), readers=config.DB_POOL_READERS, pragmas=pragmas)
+        await pool.open()
+        async with pool.writer() as db:
+            await db.execute(SCHEMA)
+            await db.commit()
+
+        async def write(i):
+            # Как в database.py: одна запись — один коммит
+            async with pool.writer() as db:
+                await db.execute(
+                    "INSERT INTO orders (user_id, service_type) VALUES (?, ?)", (i % 500, "build"),
+                )
+                await db.commit()
+
+        async def read(i):
+            async with pool.reader() as db:
+                cur = await db.execute("SELECT * FROM orders WHERE id=?", (i % writes + 1,))
+                await cur.fetchone()
+
+        async def batch(fn, n):
+            sem = asyncio.Semaphore(concurrency)
+
+            async def one(i):
+                async with sem:
+                    await fn(i)
+            t = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(n)))
+            return n / (time.perf_counter() - t)
+
+        w = await batch(write, writes)
+        r = await batch(read, reads)
+        await pool.close()
+        return w, r
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--writes", type=int, default=2000)
+    ap.add_argument("--reads", type=int, default=20000)
+    ap.add_argument("--concurrency", type=int, default=32)
+    args = ap.parse_args()
+
+    print(f"{'profile':<12}{'writes/s':>12}{'reads/s':>12}")
+    for name, pragmas in (("default", {}), ("config", config.DB_PRAGMAS)):
+        w, r = await run(pragmas, args.writes, args.reads, args.concurrency)
+        print(f"{name:<12}{w:>12.0f}{r:>12.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
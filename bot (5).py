@@ -2,9 +2,9 @@
 Inside PC — Бот + API.
 Топик создаётся при загрузке фото оплаты.
 После подтверждения — все сообщения пользователя идут менеджеру.
+Пользователь API — из токена сессии (POST /api/session, auth.py).
 """
 
-import json
 import logging
 from aiogram import Bot, Dispatcher, Router, F
 from aiogram.filters import CommandStart, CommandObject, Command
@@ -16,13 +16,18 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.client.default import DefaultBotProperties
 from aiogram.exceptions import TelegramBadRequest
-from fastapi import FastAPI, HTTPException
-from fastapi.staticfiles import StaticFiles
+from fastapi import Depends, FastAPI, HTTPException, Header, Query, Request, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 import config
 from database import *
+import events
+from auth import AuthError, Sessions, user_dependency
+from fastjson import JSONResponse
+from idempotency import IdempotencyMismatch
+from ratelimit import RateLimitMiddleware, RateLimits, ThrottleMiddleware
+from static import StaticAssets
 
 log = logging.getLogger("insidepc")
 
@@ -37,13 +42,78 @@ def S(name: str) -> dict:
 #                         FASTAPI
 # ============================================================
 
-app = FastAPI(title="Inside PC API")
+# Ответы сериализуются orjson (если установлен) — см. fastjson
+app = FastAPI(title="Inside PC API", default_response_class=JSONResponse)
+sessions = Sessions(config.BOT_TOKEN, config.SESSION_SECRET, config.SESSION_TTL,
+                    config.INIT_DATA_MAX_AGE, config.INIT_DATA_CACHE_SIZE)
+require_user = user_dependency(sessions)
+rate_limits = RateLimits(config.RATE_LIMITS, config.RATE_LIMIT_MAX_KEYS)
+# Добавлен раньше CORS — ответы 429 тоже получают CORS-заголовки
+app.add_middleware(RateLimitMiddleware, limits=rate_limits, identify=sessions.scope_user)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
-app.mount("/web", StaticFiles(directory="web", html=True), name="web")
+
+
+# Хуки общие для FastAPI и aiogram (dp.startup/dp.shutdown): в одном процессе
+# ресурсы открываются при первом старте и закрываются, когда остановились оба
+_running = 0
+
+
+@app.on_event("startup")
+async def on_startup():
+    global _running
+    _running += 1
+    if _running > 1:
+        return
+    web_assets.load()
+    await init_db()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    global _running
+    _running -= 1
+    if _running > 0:
+        return
+    await close_db()
+
+
+web_assets = StaticAssets("web", prefix="/web", dev=config.STATIC_DEV, max_age=config.STATIC_MAX_AGE)
+
+
+@app.get("/web")
+@app.get("/web/{path:path}")
+async def serve_web(request: Request, path: str = ""):
+    resp = web_assets.response(path, request.headers)
+    if resp is None:
+        raise HTTPException(404)
+    return resp
+
+
+def _can_see(uid, owner_id):
+    return uid == owner_id or uid in config.ADMIN_IDS
+
+
+class SessionIn(BaseModel):
+    init_data: str
+
+
+@app.post("/api/session")
+async def api_session(data: SessionIn):
+    """Проверенная initData Mini App -> токен сессии."""
+    try:
+        user = sessions.verify_init_data(data.init_data)
+    except AuthError as e:
+        raise HTTPException(401, str(e))
+    uid = int(user["id"])
+    full_name = " ".join(filter(None, (user.get("first_name"), user.get("last_name"))))
+    await upsert_user(uid, user.get("username") or "", full_name)
+    token, expires = sessions.issue(uid)
+    return {"token": token, "expires_at": expires, "user_id": uid}
 
 
 class OrderIn(BaseModel):
-    user_id: int
+    # Устарели и не используются: пользователь и его профиль — из сессии (/api/session)
+    user_id: int = 0
     username: str = ""
     full_name: str = ""
     service_type: str
@@ -53,32 +123,45 @@ class OrderIn(BaseModel):
 
 
 @app.post("/api/order")
-async def api_create_order(data: OrderIn):
+async def api_create_order(data: OrderIn, response: Response, uid: int = Depends(require_user),
+                           idempotency_key: str | None = Header(None, alias="Idempotency-Key")):
     if data.service_type not in config.PRICES:
         raise HTTPException(400, "Неизвестная услуга")
-    p = config.PRICES[data.service_type]
-    await upsert_user(data.user_id, data.username, data.full_name)
-    oid = await create_order(
-        data.user_id, data.service_type, data.has_parts_list,
-        data.parts_data, data.description, p["byn"], p["rub"]
-    )
-    order = await get_order(oid)
-    prefix = p.get("prefix", "")
-    return {
-        "id": oid, "status": order["status"],
-        "price_byn": p["byn"], "price_rub": p["rub"],
-        "price_prefix": prefix,
-        "payment_card": config.PAYMENT_CARD,
-        "payment_holder": config.PAYMENT_HOLDER,
-        "payment_bank": config.PAYMENT_BANK,
-        "bot_username": config.BOT_USERNAME,
-    }
+
+    async def create():
+        p = config.PRICES[data.service_type]
+        order = await create_order_returning(
+            uid, data.service_type, data.has_parts_list,
+            data.parts_data, data.description, p["byn"], p["rub"]
+        )
+        return {
+            "id": order["id"], "status": order["status"],
+            "price_byn": p["byn"], "price_rub": p["rub"],
+            "price_prefix": p.get("prefix", ""),
+            "payment_card": config.PAYMENT_CARD,
+            "payment_holder": config.PAYMENT_HOLDER,
+            "payment_bank": config.PAYMENT_BANK,
+            "bot_username": config.BOT_USERNAME,
+        }
+
+    if not idempotency_key:
+        return await create()
+    # Ключ привязан к пользователю: чужой ключ не отдаст чужой заказ
+    fingerprint = data.model_dump(exclude={"user_id", "username", "full_name"})
+    try:
+        result, replayed = await idempotency.run(f"{uid}:{idempotency_key}", fingerprint, create)
+    except IdempotencyMismatch:
+        raise HTTPException(422, "Idempotency-Key уже использован для другой заявки")
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
 
 
 @app.get("/api/status/{order_id}")
-async def api_status(order_id: int):
+async def api_status(order_id: int, uid: int = Depends(require_user)):
     order = await get_order(order_id)
-    if not order:
+    # Чужой заказ неотличим от несуществующего
+    if not order or not _can_see(uid, order["user_id"]):
         raise HTTPException(404, "Заказ не найден")
     return {
         "order_id": order["id"], "status": order["status"],
@@ -88,8 +171,11 @@ async def api_status(order_id: int):
 
 
 @app.get("/api/orders/{user_id}")
-async def api_user_orders(user_id: int):
-    orders = await get_user_orders(user_id)
+async def api_user_orders(user_id: int, before: int | None = None, limit: int = config.ORDERS_PAGE_SIZE,
+                          uid: int = Depends(require_user)):
+    if not _can_see(uid, user_id):
+        raise HTTPException(403, "Нет доступа")
+    orders, next_cursor = await get_user_orders(user_id, min(max(limit, 1), 50), before)
     result = []
     for o in orders:
         p = config.PRICES.get(o["service_type"], {})
@@ -103,26 +189,23 @@ async def api_user_orders(user_id: int):
             "price_prefix": prefix,
             "date": o["created_at"][:16],
         })
-    return result
+    page = {"items": result, "next_cursor": next_cursor}
+    if before is None:
+        page["counts"] = await get_user_order_counts(user_id)
+    return JSONResponse(page)
 
 
 @app.get("/api/order/{order_id}")
-async def api_order_detail(order_id: int):
-    order = await get_order(order_id)
-    if not order:
+async def api_order_detail(order_id: int, uid: int = Depends(require_user)):
+    order, user = await get_order_with_user(order_id)
+    if not order or not _can_see(uid, order["user_id"]):
         raise HTTPException(404, "Не найден")
-    user = await get_user(order["user_id"])
-    parts = None
-    if order["parts_data"]:
-        try:
-            parts = json.loads(order["parts_data"])
-        except:
-            pass
+    parts = order.parts
     p = config.PRICES.get(order["service_type"], {})
     return {
         "id": order["id"], "user_id": order["user_id"],
-        "username": user["username"] if user else "",
-        "full_name": user["full_name"] if user else "",
+        "username": (user and user.username) or "",
+        "full_name": (user and user.full_name) or "",
         "service": p.get("name", "?"),
         "status": order["status"],
         "status_text": STATUS_NAMES.get(order["status"], order["status"]),
@@ -133,9 +216,46 @@ async def api_order_detail(order_id: int):
     }
 
 
+async def _event_topics(uid, order, user, all_orders):
+    """Темы подписки; чужие заказы и все заказы (all) — только менеджерам."""
+    if uid not in config.ADMIN_IDS:
+        if all_orders or any(u != uid for u in user):
+            raise HTTPException(403, "Нет доступа")
+        for oid in order:
+            o = await get_order(oid)
+            if not o or o["user_id"] != uid:
+                raise HTTPException(403, "Нет доступа")
+    topics = events.topics_from_query(order, user, all_orders)
+    if not topics:
+        raise HTTPException(400, "Укажите order, user или all")
+    return topics
+
+
+# Статусы и новые заказы приходят клиенту сами: ?order=<id>&user=<id>&all=1
+# EventSource не умеет заголовки — токен передаётся в ?access_token=
+@app.get("/api/events")
+async def api_events(request: Request, order: list[int] = Query([]), user: list[int] = Query([]),
+                     all_orders: bool = Query(False, alias="all"), uid: int = Depends(require_user)):
+    topics = await _event_topics(uid, order, user, all_orders)
+    return events.sse_response(topics, request.headers.get("last-event-id"))
+
+
+@app.websocket("/api/ws")
+async def api_ws(ws: WebSocket, order: list[int] = Query([]), user: list[int] = Query([]),
+                 all_orders: bool = Query(False, alias="all"), last_id: str | None = None,
+                 access_token: str | None = None):
+    try:
+        uid = sessions.user_id(access_token=access_token)
+        topics = await _event_topics(uid, order, user, all_orders)
+    except (AuthError, HTTPException):
+        await ws.close(code=1008)
+        return
+    await events.ws_serve(ws, topics, last_id)
+
+
 @app.get("/api/prices")
 async def api_prices():
-    return config.PRICES
+    return JSONResponse(config.PRICES)
 
 
 # ============================================================
@@ -146,6 +266,10 @@ bot = Bot(token=config.BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"
 dp = Dispatcher()
 router = Router()
 dp.include_router(router)
+router.message.middleware(ThrottleMiddleware(rate_limits["bot:message"]))
+router.callback_query.middleware(ThrottleMiddleware(rate_limits["bot:callback_query"]))
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
 
 
 class States(StatesGroup):
@@ -174,9 +298,9 @@ def kb_start():
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def kb_orders(orders):
+def kb_orders(orders, next_cursor=None, paged=False):
     rows = []
-    for o in orders[:10]:
+    for o in orders:
         s = STATUS_NAMES.get(o["status"], o["status"])
         n = config.PRICES.get(o["service_type"], {}).get("name", "?")
         if o["status"] in ("payment_confirmed", "completed"):
@@ -191,6 +315,13 @@ def kb_orders(orders):
             text=f"#{o['id']} | {n} | {s}",
             callback_data=f"view:{o['id']}", **st,
         )])
+    nav = []
+    if paged:
+        nav.append(InlineKeyboardButton(text="В начало", callback_data="my_orders"))
+    if next_cursor:
+        nav.append(InlineKeyboardButton(text="Ещё", callback_data=f"my_orders:{next_cursor}"))
+    if nav:
+        rows.append(nav)
     rows.append([InlineKeyboardButton(text="Назад", callback_data="home")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
@@ -311,6 +442,7 @@ async def create_order_topic(oid, uid, username=""):
 
     tid = None
     try:
+        await rate_limits["bot:create_forum_topic"].acquire()
         topic = await bot.create_forum_topic(
             chat_id=config.MANAGER_GROUP_ID, name=f"{uname} | {sn}"
         )
@@ -323,14 +455,10 @@ async def create_order_topic(oid, uid, username=""):
 
     # Инфо о заказе
     parts_text = ""
-    if order["has_parts"] and order["parts_data"]:
-        try:
-            parts = json.loads(order["parts_data"])
-            parts_text = "\n<b>Комплектующие:</b>\n" + "".join(
-                f"  - {k}: {v}\n" for k, v in parts.items() if v
-            )
-        except:
-            pass
+    if order.has_parts and order.parts:
+        parts_text = "\n<b>Комплектующие:</b>\n" + "".join(
+            f"  - {k}: {v}\n" for k, v in order.parts.items() if v
+        )
     desc = f"\n<b>Описание:</b> {order['description']}" if order["description"] else ""
     prefix = config.PRICES.get(order["service_type"], {}).get("prefix", "")
 
@@ -434,14 +562,17 @@ async def go_home(cb: CallbackQuery, state: FSMContext):
     await cb.answer()
 
 
-@router.callback_query(F.data == "my_orders")
+@router.callback_query(F.data.startswith("my_orders"))
 async def my_orders_cb(cb: CallbackQuery):
-    orders = await get_user_orders(cb.from_user.id)
-    if not orders:
+    _, _, before = cb.data.partition(":")
+    before = int(before) if before else None
+    orders, next_cursor = await get_user_orders(cb.from_user.id, before=before)
+    if not orders and before is None:
         await safe_edit(cb.message, "У вас пока нет заказов.", reply_markup=kb_start())
         await cb.answer()
         return
-    await safe_edit(cb.message, "<b>Ваши заказы:</b>", reply_markup=kb_orders(orders))
+    await safe_edit(cb.message, "<b>Ваши заказы:</b>",
+                    reply_markup=kb_orders(orders, next_cursor, paged=before is not None))
     await cb.answer()
 
 
@@ -793,8 +924,10 @@ async def mgr_doc(msg: Message):
 @router.callback_query(F.data.startswith("cpay:"))
 async def confirm_pay(cb: CallbackQuery):
     oid = int(cb.data.split(":")[1])
-    await update_status(oid, "payment_confirmed")
-    order = await get_order(oid)
+    order = await update_status_returning(oid, "payment_confirmed")
+    if not order:
+        await cb.answer("Не найден", show_alert=True)
+        return
     try:
         await bot.send_message(order["user_id"],
             f"<b>Inside PC — Оплата заказа #{oid} подтверждена!</b>\n"
@@ -811,8 +944,10 @@ async def confirm_pay(cb: CallbackQuery):
 @router.callback_query(F.data.startswith("rpay:"))
 async def reject_pay(cb: CallbackQuery):
     oid = int(cb.data.split(":")[1])
-    await update_status(oid, "pending_payment")
-    order = await get_order(oid)
+    order = await update_status_returning(oid, "pending_payment")
+    if not order:
+        await cb.answer("Не найден", show_alert=True)
+        return
     try:
         await bot.send_message(order["user_id"],
             f"<b>Inside PC — Оплата #{oid} не подтверждена.</b>\n"
@@ -832,8 +967,10 @@ async def reject_pay(cb: CallbackQuery):
 async def set_status_cb(cb: CallbackQuery):
     parts = cb.data.split(":")
     oid, new_st = int(parts[1]), parts[2]
-    await update_status(oid, new_st)
-    order = await get_order(oid)
+    order = await update_status_returning(oid, new_st)
+    if not order:
+        await cb.answer("Не найден", show_alert=True)
+        return
     st_text = STATUS_NAMES.get(new_st, new_st)
 
     if new_st == "in_progress":
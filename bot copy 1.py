@@ -1,11 +1,15 @@
 """
 Inside PC — Бот + API + Портфолио.
+Пользователь API — из токена сессии (POST /api/session, auth.py).
 """
 
 import asyncio
+import hashlib
+import html
 import json
 import logging
 import os
+import re
 
 from aiogram import Bot, Dispatcher, Router, F
 from aiogram.filters import CommandStart, CommandObject, Command
@@ -17,15 +21,25 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.client.default import DefaultBotProperties
 from aiogram.exceptions import TelegramBadRequest
-from fastapi import FastAPI, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi import Depends, FastAPI, HTTPException, Header, Query, Request, WebSocket
+from fastapi.responses import FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional
 
 import config
+import fastjson
+from auth import AuthError, Sessions, user_dependency
+from cache import Snapshot
+from fastjson import JSONResponse
+from files import FileResolver
+from idempotency import IdempotencyMismatch
+from media import MediaCache
+from ratelimit import RateLimitMiddleware, RateLimits, ThrottleMiddleware
+from static import StaticAssets
+from thumbs import Thumbnailer
 from database import *
+import events
 
 log = logging.getLogger("insidepc")
 
@@ -40,45 +54,87 @@ def S(name: str) -> dict:
 #                         FASTAPI
 # ============================================================
 
-app = FastAPI(title="Inside PC API")
+# Ответы сериализуются orjson (если установлен) — см. fastjson
+app = FastAPI(title="Inside PC API", default_response_class=JSONResponse)
+sessions = Sessions(config.BOT_TOKEN, config.SESSION_SECRET, config.SESSION_TTL,
+                    config.INIT_DATA_MAX_AGE, config.INIT_DATA_CACHE_SIZE)
+require_user = user_dependency(sessions)
+rate_limits = RateLimits(config.RATE_LIMITS, config.RATE_LIMIT_MAX_KEYS)
+# Добавлен раньше CORS — ответы 429 тоже получают CORS-заголовки
+app.add_middleware(RateLimitMiddleware, limits=rate_limits, identify=sessions.scope_user)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
+
+# Хуки общие для FastAPI и aiogram (dp.startup/dp.shutdown): в одном процессе
+# ресурсы открываются при первом старте и закрываются, когда остановились оба
+_running = 0
+
+
+@app.on_event("startup")
+async def on_startup():
+    global _running
+    _running += 1
+    if _running > 1:
+        return
+    web_assets.load()
+    await init_db()
+    notifier.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    global _running
+    _running -= 1
+    if _running > 0:
+        return
+    await notifier.stop()
+    thumbs.close()
+    await media.close()
+    await close_db()
+
+
 WEB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web")
+web_assets = StaticAssets(WEB_DIR, prefix="/web", dev=config.STATIC_DEV, max_age=config.STATIC_MAX_AGE)
 
 
+# /web, /web/admin, /web/portfolio.html, /web/app.<хэш>.js — из памяти, со сжатием и ETag
 @app.get("/web")
-@app.get("/web/")
-@app.get("/web/index.html")
-async def serve_index():
-    p = os.path.join(WEB_DIR, "index.html")
-    if not os.path.isfile(p):
+@app.get("/web/{path:path}")
+async def serve_web(request: Request, path: str = ""):
+    if path.strip("/") in ("", "index", "index.html"):
+        return await serve_index(request)
+    # /web/static/... — старые ссылки на тот же каталог
+    resp = (web_assets.response(path, request.headers)
+            or web_assets.response(path.removeprefix("static/"), request.headers))
+    if resp is None:
         raise HTTPException(404)
-    return FileResponse(p, media_type="text/html")
+    return resp
 
 
-@app.get("/web/admin")
-@app.get("/web/admin.html")
-async def serve_admin():
-    p = os.path.join(WEB_DIR, "admin.html")
-    if not os.path.isfile(p):
-        raise HTTPException(404)
-    return FileResponse(p, media_type="text/html")
+def _can_see(uid, owner_id):
+    return uid == owner_id or uid in config.ADMIN_IDS
 
 
-@app.get("/web/portfolio")
-@app.get("/web/portfolio.html")
-async def serve_portfolio_admin():
-    p = os.path.join(WEB_DIR, "portfolio.html")
-    if not os.path.isfile(p):
-        raise HTTPException(404)
-    return FileResponse(p, media_type="text/html")
+async def require_admin(uid: int = Depends(require_user)) -> int:
+    """Зависимость для правки портфолио: только менеджеры из ADMIN_IDS."""
+    if uid not in config.ADMIN_IDS:
+        raise HTTPException(403, "Нет доступа")
+    return uid
 
 
-app.mount("/web/static", StaticFiles(directory=WEB_DIR), name="web_static")
+class SessionIn(BaseModel):
+    init_data: str
 
 
-class OrderIn(BaseModel):
+class SessionOut(BaseModel):
+    token: str
+    expires_at: int
     user_id: int
+
+
+class OrderIn(BaseModel):
+    # Устарели и не используются: пользователь и его профиль — из сессии (/api/session)
+    user_id: int = 0
     username: str = ""
     full_name: str = ""
     service_type: str
@@ -87,60 +143,124 @@ class OrderIn(BaseModel):
     description: str = ""
 
 
+# Модели ответов — для схемы OpenAPI. Горячие маршруты возвращают JSONResponse
+# сами, поэтому FastAPI не валидирует и не перекодирует ответ ещё раз.
+class OrderItemOut(BaseModel):
+    id: int
+    service: str
+    status: str
+    status_text: str
+    price_byn: float | None
+    price_rub: float | None
+    price_prefix: str
+    date: str
+
+
+class OrdersPageOut(BaseModel):
+    items: list[OrderItemOut]
+    next_cursor: int | None
+    counts: dict[str, int] | None = None
+
+
+class UserOut(BaseModel):
+    user_id: int
+    username: str
+    full_name: str
+
+
+class BootstrapOut(BaseModel):
+    user: UserOut | None
+    orders: OrdersPageOut
+    prices: dict
+    portfolio_etag: str
+
+
+@app.post("/api/session", response_model=SessionOut)
+async def api_session(data: SessionIn):
+    """Проверенная initData Mini App -> токен сессии."""
+    try:
+        user = sessions.verify_init_data(data.init_data)
+    except AuthError as e:
+        raise HTTPException(401, str(e))
+    uid = int(user["id"])
+    full_name = " ".join(filter(None, (user.get("first_name"), user.get("last_name"))))
+    await upsert_user(uid, user.get("username") or "", full_name)
+    token, expires = sessions.issue(uid)
+    return JSONResponse({"token": token, "expires_at": expires, "user_id": uid})
+
+
 @app.post("/api/order")
-async def api_create_order(data: OrderIn):
+async def api_create_order(data: OrderIn, response: Response, uid: int = Depends(require_user),
+                           idempotency_key: str | None = Header(None, alias="Idempotency-Key")):
     if data.service_type not in config.PRICES:
         raise HTTPException(400, "Неизвестная услуга")
-    p = config.PRICES[data.service_type]
-    await upsert_user(data.user_id, data.username, data.full_name)
-    needs_quote = p.get("needs_quote", False)
-    status = "pending_quote" if needs_quote else "pending_payment"
-    oid = await create_order(
-        data.user_id, data.service_type, data.has_parts_list,
-        data.parts_data, data.description, p["byn"], p["rub"], status=status,
-    )
-    if needs_quote:
-        try:
-            await _handle_new_quote(oid, data.user_id, data.username)
-        except Exception as e:
-            log.error(f"quote init: {e}")
-    return {"id": oid, "needs_quote": needs_quote, "bot_username": config.BOT_USERNAME}
 
+    async def create():
+        p = config.PRICES[data.service_type]
+        needs_quote = p.get("needs_quote", False)
+        status = "pending_quote" if needs_quote else "pending_payment"
+        # Топик и уведомления по заявке на оценку уходят через outbox
+        oid = await create_order(
+            uid, data.service_type, data.has_parts_list,
+            data.parts_data, data.description, p["byn"], p["rub"], status=status,
+            notify=("quote_manager", "quote_user") if needs_quote else (),
+        )
+        return {"id": oid, "needs_quote": needs_quote, "bot_username": config.BOT_USERNAME}
 
-@app.get("/api/orders/{user_id}")
-async def api_user_orders(user_id: int):
-    orders = await get_user_orders(user_id)
-    out = []
-    for o in orders:
-        p = config.PRICES.get(o["service_type"], {})
-        out.append({
-            "id": o["id"], "service": p.get("name", "?"),
-            "status": o["status"],
-            "status_text": STATUS_NAMES.get(o["status"], o["status"]),
-            "price_byn": o["price_byn"], "price_rub": o["price_rub"],
-            "price_prefix": p.get("prefix", ""),
-            "date": o["created_at"][:16],
-        })
-    return out
+    if not idempotency_key:
+        return await create()
+    fingerprint = data.model_dump(exclude={"user_id", "username", "full_name"})
+    try:
+        result, replayed = await idempotency.run(f"{uid}:{idempotency_key}", fingerprint, create)
+    except IdempotencyMismatch:
+        raise HTTPException(422, "Idempotency-Key уже использован для другой заявки")
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+
+def _order_item(o):
+    p = config.PRICES.get(o["service_type"], {})
+    return {
+        "id": o["id"], "service": p.get("name", "?"),
+        "status": o["status"],
+        "status_text": STATUS_NAMES.get(o["status"], o["status"]),
+        "price_byn": o["price_byn"], "price_rub": o["price_rub"],
+        "price_prefix": p.get("prefix", ""),
+        "date": o["created_at"][:16],
+    }
+
+
+async def _orders_page(user_id, before=None, limit=config.ORDERS_PAGE_SIZE):
+    """Страница истории; первая — вместе со счётчиками по статусам (запросы идут параллельно)."""
+    if before is None:
+        (orders, next_cursor), counts = await asyncio.gather(
+            get_user_orders(user_id, limit), get_user_order_counts(user_id),
+        )
+        return {"items": [_order_item(o) for o in orders], "next_cursor": next_cursor, "counts": counts}
+    orders, next_cursor = await get_user_orders(user_id, limit, before)
+    return {"items": [_order_item(o) for o in orders], "next_cursor": next_cursor}
+
+
+@app.get("/api/orders/{user_id}", response_model=OrdersPageOut)
+async def api_user_orders(user_id: int, before: int | None = None, limit: int = config.ORDERS_PAGE_SIZE,
+                          uid: int = Depends(require_user)):
+    if not _can_see(uid, user_id):
+        raise HTTPException(403, "Нет доступа")
+    return JSONResponse(await _orders_page(user_id, before, min(max(limit, 1), 50)))
 
 
 @app.get("/api/order/{order_id}")
-async def api_order_detail(order_id: int):
-    order = await get_order(order_id)
-    if not order:
+async def api_order_detail(order_id: int, uid: int = Depends(require_user)):
+    order, user = await get_order_with_user(order_id)
+    if not order or not _can_see(uid, order["user_id"]):
         raise HTTPException(404)
-    user = await get_user(order["user_id"])
-    parts = None
-    if order["parts_data"]:
-        try:
-            parts = json.loads(order["parts_data"])
-        except Exception:
-            pass
+    parts = order.parts
     p = config.PRICES.get(order["service_type"], {})
-    return {
+    return JSONResponse({
         "id": order["id"], "user_id": order["user_id"],
-        "username": user["username"] if user else "",
-        "full_name": user["full_name"] if user else "",
+        "username": (user and user.username) or "",
+        "full_name": (user and user.full_name) or "",
         "service": p.get("name", "?"),
         "status": order["status"],
         "status_text": STATUS_NAMES.get(order["status"], order["status"]),
@@ -148,7 +268,7 @@ async def api_order_detail(order_id: int):
         "price_prefix": p.get("prefix", ""),
         "has_parts": order["has_parts"], "parts": parts,
         "description": order["description"], "date": order["created_at"][:16],
-    }
+    })
 
 
 # ---- PORTFOLIO API ----
@@ -162,45 +282,169 @@ class PortfolioIn(BaseModel):
     category: str = ""
 
 
-@app.get("/api/portfolio")
-async def api_portfolio():
-    items = await get_portfolio_all()
+class PortfolioPatch(BaseModel):
+    """Частичное изменение: None — поле не трогаем. version — для защиты от перезаписи."""
+    title: str | None = None
+    description: str | None = None
+    specs: str | None = None
+    price_byn: float | None = None
+    price_rub: float | None = None
+    category: str | None = None
+    is_visible: int | None = None
+    version: int | None = None
+
+
+class PortfolioBulkItem(PortfolioPatch):
+    id: int
+
+
+class PortfolioBulkIn(BaseModel):
+    items: list[PortfolioBulkItem]
+
+
+def _patch_fields(data, item=None):
+    """Заданные поля патча; если передана текущая запись — только изменённые."""
+    return {
+        k: v for k, v in data
+        if k in PORTFOLIO_FIELDS and v is not None and (item is None or item[k] != v)
+    }
+
+
+async def _build_portfolio_feed():
+    """Лента портфолио: готовые байты JSON и ETag по их хэшу."""
     out = []
-    for item in items:
-        try:
-            photos = json.loads(item["photo_ids"])
-        except Exception:
-            photos = []
+    for item in await get_portfolio_all():
+        photos = item.photos
         out.append({
             "id": item["id"], "title": item["title"],
             "description": item["description"], "specs": item["specs"],
             "price_byn": item["price_byn"], "price_rub": item["price_rub"],
             "category": item["category"],
             "photos": photos, "photo_count": len(photos),
+            "images": [thumbs.srcset(f) for f in photos],
             "date": item["created_at"][:16],
         })
-    return out
+    body = fastjson.dumps(out)
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    # Какие file_id можно отдавать через /media (фото оплаты и т.п. — нельзя)
+    photos = {fid for item in out for fid in item["photos"]}
+    return body, etag, photos
+
+
+# Пересобирается только после записей в портфолио
+portfolio_feed = Snapshot(_build_portfolio_feed, portfolio_version)
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match", "")
+    return header.strip() == "*" or etag in (t.strip().removeprefix("W/") for t in header.split(","))
+
+
+# ---- MINI APP: серверная отрисовка ----
+
+_PRICE_SPAN = re.compile(rb'(<span class="cp[^"]*" data-price="(\w+)">)[^<]*(</span>)')
+
+
+def _prices_json():
+    return json.dumps(config.PRICES, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def _script_json(data: bytes) -> bytes:
+    """JSON для вставки в <script>: "</" и U+2028/2029 внутри строк экранируются."""
+    return (data.replace(b"</", b"<\\/")
+            .replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029"))
+
+
+def _price_text(p):
+    prefix = p.get("prefix", "")
+    return f"{prefix}{p['byn']} BYN / {prefix}{p['rub']} RUB"
+
+
+async def _render_index():
+    """index.html с ценами и лентой портфолио в window.__BOOT__ — первый экран без запросов к API."""
+    template = web_assets.get("index.html")
+    if template is None:
+        return None
+    feed, etag, _ = await portfolio_feed.get()
+
+    def price(m):
+        p = config.PRICES.get(m.group(2).decode())
+        return m.group(1) + html.escape(_price_text(p)).encode() + m.group(3) if p else m.group(0)
+
+    boot = b'{"prices":%s,"portfolio":%s,"portfolio_etag":%s}' % (
+        _prices_json().encode(), feed, json.dumps(etag).encode(),
+    )
+    body = _PRICE_SPAN.sub(price, template.body).replace(b"/*BOOT*/null", _script_json(boot), 1)
+    return web_assets.build("index.html", body)
+
+
+def _index_version():
+    template = web_assets.get("index.html")
+    return portfolio_version(), template and template.digest, _prices_json()
+
+
+# Перерисовывается только при изменении портфолио, цен или самого шаблона
+index_page = Snapshot(_render_index, _index_version)
+
+
+async def serve_index(request: Request):
+    page = await index_page.get()
+    if page is None:
+        raise HTTPException(404)
+    return web_assets.send(page, request.headers)
+
+
+@app.get("/api/bootstrap", response_model=BootstrapOut)
+async def api_bootstrap(user_id: int | None = None, uid: int = Depends(require_user)):
+    """
+    Всё для старта Mini App одним запросом: профиль, первая страница заказов
+    со счётчиками, цены и ETag ленты портфолио. Профиль и лента обычно уже
+    в кэше, заказы и счётчики читаются параллельно на разных соединениях.
+    Без user_id — для пользователя сессии.
+    """
+    if user_id is None:
+        user_id = uid
+    elif not _can_see(uid, user_id):
+        raise HTTPException(403, "Нет доступа")
+    user, orders, (_, portfolio_etag, _) = await asyncio.gather(
+        get_user(user_id), _orders_page(user_id), portfolio_feed.get(),
+    )
+    return JSONResponse({
+        "user": user and {"user_id": user.user_id, "username": user.username or "", "full_name": user.full_name or ""},
+        "orders": orders,
+        "prices": config.PRICES,
+        "portfolio_etag": portfolio_etag,
+    })
+
+
+@app.get("/api/portfolio")
+async def api_portfolio(request: Request):
+    body, etag, _ = await portfolio_feed.get()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @app.get("/api/portfolio/{pid}")
 async def api_portfolio_item(pid: int):
     item = await get_portfolio_item(pid)
-    if not item:
+    # Скрытые работы — как в ленте: их фото /media не отдаёт
+    if not item or not item["is_visible"]:
         raise HTTPException(404)
-    try:
-        photos = json.loads(item["photo_ids"])
-    except Exception:
-        photos = []
-    return {
+    photos = item.photos
+    return JSONResponse({
         "id": item["id"], "title": item["title"],
         "description": item["description"], "specs": item["specs"],
         "price_byn": item["price_byn"], "price_rub": item["price_rub"],
         "category": item["category"], "photos": photos,
+        "images": [thumbs.srcset(f) for f in photos],
         "is_visible": item["is_visible"], "date": item["created_at"][:16],
-    }
+        "version": item.version,
+    })
 
 
-@app.post("/api/portfolio")
+@app.post("/api/portfolio", dependencies=[Depends(require_admin)])
 async def api_portfolio_create(data: PortfolioIn):
     pid = await add_portfolio_item(
         data.title, data.description, data.specs,
@@ -209,39 +453,146 @@ async def api_portfolio_create(data: PortfolioIn):
     return {"id": pid}
 
 
-@app.put("/api/portfolio/{pid}")
-async def api_portfolio_update(pid: int, data: PortfolioIn):
+@app.put("/api/portfolio", dependencies=[Depends(require_admin)])
+async def api_portfolio_bulk_update(data: PortfolioBulkIn):
+    try:
+        versions = await update_portfolio_many(
+            {"id": u.id, "version": u.version, **_patch_fields(u)} for u in data.items
+        )
+    except VersionConflict as e:
+        raise HTTPException(409, {"id": e.pid, "version": e.version})
+    return {"ok": True, "versions": versions}
+
+
+@app.put("/api/portfolio/{pid}", dependencies=[Depends(require_admin)])
+async def api_portfolio_update(pid: int, data: PortfolioPatch):
     item = await get_portfolio_item(pid)
     if not item:
         raise HTTPException(404)
-    await update_portfolio(pid,
-        title=data.title, description=data.description,
-        specs=data.specs, price_byn=data.price_byn,
-        price_rub=data.price_rub, category=data.category,
-    )
-    return {"ok": True}
+    try:
+        version = await update_portfolio(pid, data.version, **_patch_fields(data, item))
+    except VersionConflict as e:
+        raise HTTPException(409, {"id": e.pid, "version": e.version})
+    if version is None:
+        raise HTTPException(404)
+    return {"ok": True, "version": version}
 
 
-@app.delete("/api/portfolio/{pid}")
+@app.delete("/api/portfolio/{pid}", dependencies=[Depends(require_admin)])
 async def api_portfolio_delete(pid: int):
     await delete_portfolio(pid)
     return {"ok": True}
 
 
+class PhotoOrderIn(BaseModel):
+    order: list[int]
+
+
+@app.delete("/api/portfolio/{pid}/photos/{index}", dependencies=[Depends(require_admin)])
+async def api_portfolio_photo_delete(pid: int, index: int):
+    if not await remove_portfolio_photo(pid, index):
+        raise HTTPException(404)
+    return {"ok": True}
+
+
+@app.put("/api/portfolio/{pid}/photos/order", dependencies=[Depends(require_admin)])
+async def api_portfolio_photo_order(pid: int, data: PhotoOrderIn):
+    if not await reorder_portfolio_photos(pid, data.order):
+        raise HTTPException(404)
+    return {"ok": True}
+
+
+async def _portfolio_photos():
+    return (await portfolio_feed.get())[2]
+
+
 @app.get("/api/portfolio/{pid}/photo/{file_id}")
 async def api_portfolio_photo_url(pid: int, file_id: str):
-    """Получить URL фото через Bot API."""
-    try:
-        file = await bot.get_file(file_id)
-        url = f"https://api.telegram.org/file/bot{config.BOT_TOKEN}/{file.file_path}"
-        return {"url": url}
-    except Exception:
+    """URL фото (через /media — без токена бота)."""
+    if file_id not in await _portfolio_photos() or not await files.path(file_id):
         raise HTTPException(404, "Фото не найдено")
+    return {"url": f"/media/{file_id}"}
+
+
+class FileIdsIn(BaseModel):
+    file_ids: list[str]
+
+
+@app.post("/api/files/resolve")
+async def api_files_resolve(data: FileIdsIn):
+    """URL сразу для пачки file_id: {file_id: url | null}."""
+    if len(data.file_ids) > config.FILE_RESOLVE_BATCH_MAX:
+        raise HTTPException(413, f"Не больше {config.FILE_RESOLVE_BATCH_MAX} file_id")
+    allowed = await _portfolio_photos()
+    paths = await files.paths(f for f in data.file_ids if f in allowed)
+    return {"urls": {fid: f"/media/{fid}" if paths.get(fid) else None for fid in data.file_ids}}
+
+
+_MEDIA_HEADERS = {"Cache-Control": f"public, max-age={config.MEDIA_MAX_AGE}, immutable"}
+
+
+@app.get("/media/{file_id}")
+async def media_file(file_id: str):
+    """Фото портфолио из локального кэша: Range, неизменяемый кэш у клиента."""
+    if file_id not in await _portfolio_photos():
+        raise HTTPException(404)
+    path = await media.get(file_id)
+    if not path:
+        raise HTTPException(404)
+    return FileResponse(path, media_type=media.media_type(path), headers=_MEDIA_HEADERS)
+
+
+@app.get("/media/{file_id}/{width}")
+async def media_thumb(file_id: str, width: int):
+    """WebP-версия фото шириной width (из THUMB_WIDTHS)."""
+    if file_id not in await _portfolio_photos() or width not in thumbs.widths:
+        raise HTTPException(404)
+    path = await thumbs.get(file_id, width)
+    if not path:
+        raise HTTPException(404)
+    return FileResponse(path, media_type=media.media_type(path), headers=_MEDIA_HEADERS)
+
+
+async def _event_topics(uid, order, user, all_orders):
+    """Темы подписки; чужие заказы и все заказы (all) — только менеджерам."""
+    if uid not in config.ADMIN_IDS:
+        if all_orders or any(u != uid for u in user):
+            raise HTTPException(403, "Нет доступа")
+        for oid in order:
+            o = await get_order(oid)
+            if not o or o["user_id"] != uid:
+                raise HTTPException(403, "Нет доступа")
+    topics = events.topics_from_query(order, user, all_orders)
+    if not topics:
+        raise HTTPException(400, "Укажите order, user или all")
+    return topics
+
+
+# Статусы и новые заказы приходят клиенту сами: ?order=<id>&user=<id>&all=1
+# EventSource не умеет заголовки — токен передаётся в ?access_token=
+@app.get("/api/events")
+async def api_events(request: Request, order: list[int] = Query([]), user: list[int] = Query([]),
+                     all_orders: bool = Query(False, alias="all"), uid: int = Depends(require_user)):
+    topics = await _event_topics(uid, order, user, all_orders)
+    return events.sse_response(topics, request.headers.get("last-event-id"))
+
+
+@app.websocket("/api/ws")
+async def api_ws(ws: WebSocket, order: list[int] = Query([]), user: list[int] = Query([]),
+                 all_orders: bool = Query(False, alias="all"), last_id: str | None = None,
+                 access_token: str | None = None):
+    try:
+        uid = sessions.user_id(access_token=access_token)
+        topics = await _event_topics(uid, order, user, all_orders)
+    except (AuthError, HTTPException):
+        await ws.close(code=1008)
+        return
+    await events.ws_serve(ws, topics, last_id)
 
 
 @app.get("/api/prices")
 async def api_prices():
-    return config.PRICES
+    return JSONResponse(config.PRICES)
 
 
 # ============================================================
@@ -249,9 +600,29 @@ async def api_prices():
 # ============================================================
 
 bot = Bot(token=config.BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+files = FileResolver(
+    bot, config.TELEGRAM_FILE_BASE, ttl=config.FILE_PATH_TTL,
+    maxsize=config.FILE_PATH_CACHE_SIZE, concurrency=config.FILE_RESOLVE_CONCURRENCY,
+)
+media = MediaCache(config.MEDIA_CACHE_DIR, files, max_bytes=config.MEDIA_CACHE_MAX_BYTES)
+thumbs = Thumbnailer(media, config.THUMB_WIDTHS, quality=config.THUMB_QUALITY, workers=config.THUMB_WORKERS)
+_background = set()
+
+
+def _spawn(coro):
+    """Фоновая задача, ссылка на которую держится до её завершения."""
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
 dp = Dispatcher()
 router = Router()
 dp.include_router(router)
+router.message.middleware(ThrottleMiddleware(rate_limits["bot:message"]))
+router.callback_query.middleware(ThrottleMiddleware(rate_limits["bot:callback_query"]))
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
 
 
 class States(StatesGroup):
@@ -357,9 +728,9 @@ def kb_start():
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
-def kb_orders(orders):
+def kb_orders(orders, next_cursor=None, paged=False):
     rows = []
-    for o in orders[:10]:
+    for o in orders:
         s = STATUS_NAMES.get(o["status"], o["status"])
         n = config.PRICES.get(o["service_type"], {}).get("name", "?")
         st = {}
@@ -370,6 +741,13 @@ def kb_orders(orders):
         elif o["status"] == "in_progress":
             st = S("primary")
         rows.append([InlineKeyboardButton(text=f"#{o['id']} | {n} | {s}", callback_data=f"view:{o['id']}", **st)])
+    nav = []
+    if paged:
+        nav.append(InlineKeyboardButton(text="В начало", callback_data="my_orders"))
+    if next_cursor:
+        nav.append(InlineKeyboardButton(text="Ещё", callback_data=f"my_orders:{next_cursor}"))
+    if nav:
+        rows.append(nav)
     rows.append([InlineKeyboardButton(text="Назад", callback_data="home")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
@@ -419,13 +797,24 @@ def kb_pf_item(pid):
          InlineKeyboardButton(text="Характеристики", callback_data=f"pf:specs:{pid}")],
         [InlineKeyboardButton(text="Цена", callback_data=f"pf:price:{pid}"),
          InlineKeyboardButton(text="Описание", callback_data=f"pf:desc:{pid}")],
-        [InlineKeyboardButton(text="Добавить фото", callback_data=f"pf:photo:{pid}", **S("primary"))],
+        [InlineKeyboardButton(text="Добавить фото", callback_data=f"pf:photo:{pid}", **S("primary")),
+         InlineKeyboardButton(text="Фото", callback_data=f"pf:phs:{pid}")],
         [InlineKeyboardButton(text="Удалить работу", callback_data=f"pf:del:{pid}", **S("danger"))],
         [InlineKeyboardButton(text="Назад к списку", callback_data="pf:list")],
     ]
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+def kb_pf_photos(pid, count):
+    rows = [
+        [InlineKeyboardButton(text=f"{i + 1}: обложкой", callback_data=f"pf:phtop:{pid}:{i}"),
+         InlineKeyboardButton(text=f"{i + 1}: удалить", callback_data=f"pf:phdel:{pid}:{i}", **S("danger"))]
+        for i in range(count)
+    ]
+    rows.append([InlineKeyboardButton(text="Назад", callback_data=f"pf:edit:{pid}")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
 def kb_pf_manage():
     url = _portfolio_url()
     rows = [
@@ -450,14 +839,10 @@ def _order_text(oid, order, uname, is_quote=False):
         text += f"Мин. стоимость: {prefix}{order['price_byn']} BYN / {prefix}{order['price_rub']} RUB\n\n<b>Назначьте цену кнопкой.</b>"
     else:
         text += f"Стоимость: {order['price_byn']} BYN / {order['price_rub']} RUB"
-    if order["has_parts"] and order["parts_data"]:
-        try:
-            parts = json.loads(order["parts_data"])
-            lines = "".join(f"  — {k}: {v}\n" for k, v in parts.items() if v)
-            if lines:
-                text += f"\n\n<b>Комплектующие:</b>\n{lines}"
-        except Exception:
-            pass
+    if order.has_parts and order.parts:
+        lines = "".join(f"  — {k}: {v}\n" for k, v in order.parts.items() if v)
+        if lines:
+            text += f"\n\n<b>Комплектующие:</b>\n{lines}"
     if order["description"]:
         text += f"\n\n<b>Описание:</b>\n{order['description']}"
     return text
@@ -467,6 +852,14 @@ def _order_text(oid, order, uname, is_quote=False):
 #  ТОПИКИ
 # ============================================================
 
+async def _client_name(uid, username=""):
+    """@username для названия топика; без username — из кэша профилей."""
+    if not username:
+        user = await get_user(uid)
+        username = user["username"] if user else ""
+    return f"@{username}" if username else f"ID:{uid}"
+
+
 async def _create_topic(oid, uid, username=""):
     if not config.MANAGER_GROUP_ID:
         return None
@@ -474,8 +867,9 @@ async def _create_topic(oid, uid, username=""):
     if not order:
         return None
     sn = config.PRICES.get(order["service_type"], {}).get("name", "?")
-    uname = f"@{username}" if username else f"ID:{uid}"
+    uname = await _client_name(uid, username)
     try:
+        await rate_limits["bot:create_forum_topic"].acquire()
         t = await bot.create_forum_topic(chat_id=config.MANAGER_GROUP_ID, name=f"{uname} | {sn}")
         tid = t.message_thread_id
         await save_topic(tid, oid, uid)
@@ -491,30 +885,44 @@ async def _create_topic(oid, uid, username=""):
 
 
 async def _handle_new_quote(oid, uid, username=""):
+    """Топик и карточка заявки для менеджеров. Ошибки — наружу: outbox повторит."""
     if not config.MANAGER_GROUP_ID:
         return
     order = await get_order(oid)
     if not order:
         return
     sn = config.PRICES.get(order["service_type"], {}).get("name", "?")
-    uname = f"@{username}" if username else f"ID:{uid}"
-    try:
+    uname = await _client_name(uid, username)
+    link = await get_topic_by_order(oid)
+    if link:
+        tid = link.topic_id
+    else:
+        await rate_limits["bot:create_forum_topic"].acquire()
         t = await bot.create_forum_topic(chat_id=config.MANAGER_GROUP_ID, name=f"{uname} | {sn}", icon_color=7322096)
         tid = t.message_thread_id
         await save_topic(tid, oid, uid)
-    except Exception as e:
-        log.error(f"quote topic: {e}")
-        return
     text = _order_text(oid, order, uname, is_quote=True)
-    try:
-        await safe_send(config.MANAGER_GROUP_ID, text, reply_markup=kb_quote(oid), message_thread_id=tid)
-    except Exception as e:
-        log.error(f"quote msg: {e}")
-    try:
-        await bot.send_message(uid,
+    await safe_send(config.MANAGER_GROUP_ID, text, reply_markup=kb_quote(oid), message_thread_id=tid)
+
+
+async def _job_quote_manager(job):
+    order = await get_order(job["order_id"])
+    if order:
+        await _handle_new_quote(order.id, order.user_id)
+
+
+async def _job_quote_user(job):
+    oid = job["order_id"]
+    order = await get_order(oid)
+    if order:
+        await bot.send_message(order.user_id,
             f"<b>Inside PC — Заявка #{oid}</b>\n\nЗаявка на апгрейд отправлена менеджеру.\nМы рассчитаем стоимость и отправим реквизиты сюда.")
-    except Exception as e:
-        log.error(f"quote user: {e}")
+
+
+notifier = outbox_worker({
+    "quote_manager": _job_quote_manager,
+    "quote_user": _job_quote_user,
+}, max_attempts=config.OUTBOX_MAX_ATTEMPTS, poll=config.OUTBOX_POLL)
 
 
 async def create_portfolio_topic():
@@ -522,6 +930,7 @@ async def create_portfolio_topic():
     if not config.MANAGER_GROUP_ID:
         return
     try:
+        await rate_limits["bot:create_forum_topic"].acquire()
         t = await bot.create_forum_topic(chat_id=config.MANAGER_GROUP_ID, name="Портфолио", icon_color=16766590)
         tid = t.message_thread_id
         await safe_send(
@@ -658,11 +1067,14 @@ async def go_home(cb: CallbackQuery, state: FSMContext):
     await cb.answer()
 
 
-@router.callback_query(F.data == "my_orders")
+@router.callback_query(F.data.startswith("my_orders"))
 async def my_orders(cb: CallbackQuery):
-    orders = await get_user_orders(cb.from_user.id)
-    text = "<b>Ваши заказы:</b>" if orders else "Заказов нет."
-    kb = kb_orders(orders) if orders else kb_start()
+    _, _, before = cb.data.partition(":")
+    before = int(before) if before else None
+    orders, next_cursor = await get_user_orders(cb.from_user.id, before=before)
+    paged = before is not None
+    text = "<b>Ваши заказы:</b>" if orders or paged else "Заказов нет."
+    kb = kb_orders(orders, next_cursor, paged) if orders or paged else kb_start()
     try:
         await safe_edit(cb.message, text, reply_markup=kb)
     except Exception:
@@ -735,11 +1147,10 @@ async def recv_photo(msg: Message, state: FSMContext):
         return
     fid = msg.photo[-1].file_id
     await save_payment_photo(oid, fid)
-    user = await get_user(msg.from_user.id)
     existing = await get_topic_by_order(oid)
     tid = existing["topic_id"] if existing else None
     if not tid:
-        tid = await _create_topic(oid, msg.from_user.id, user["username"] if user else "")
+        tid = await _create_topic(oid, msg.from_user.id)
     if config.MANAGER_GROUP_ID and tid:
         try:
             await safe_photo(config.MANAGER_GROUP_ID, fid, caption=f"<b>Фото оплаты #{oid}</b>", reply_markup=kb_admin_pay(oid), message_thread_id=tid)
@@ -832,10 +1243,7 @@ async def pf_list(cb: CallbackQuery):
     rows = []
     for item in items:
         title = item["title"] or f"Без названия #{item['id']}"
-        try:
-            pc = len(json.loads(item["photo_ids"]))
-        except Exception:
-            pc = 0
+        pc = len(item.photos)
         rows.append([InlineKeyboardButton(text=f"#{item['id']} | {title} | {pc} фото", callback_data=f"pf:edit:{item['id']}")])
     rows.append([InlineKeyboardButton(text="Добавить работу", callback_data="pf:new", **S("success"))])
     await cb.message.answer("<b>Портфолио:</b>", reply_markup=InlineKeyboardMarkup(inline_keyboard=rows))
@@ -849,10 +1257,7 @@ async def pf_edit(cb: CallbackQuery):
     if not item:
         await cb.answer("Не найдено", show_alert=True)
         return
-    try:
-        photos = json.loads(item["photo_ids"])
-    except Exception:
-        photos = []
+    photos = item.photos
     text = (
         f"<b>Работа #{pid}</b>\n\n"
         f"Название: {item['title'] or '—'}\n"
@@ -959,13 +1364,11 @@ async def pf_add_photo(cb: CallbackQuery, state: FSMContext):
 async def pf_photo_input(msg: Message, state: FSMContext):
     data = await state.get_data()
     pid = data["pf_id"]
-    fid = msg.photo[-1].file_id
-    await add_portfolio_photo(pid, fid)
-    item = await get_portfolio_item(pid)
-    try:
-        cnt = len(json.loads(item["photo_ids"]))
-    except Exception:
-        cnt = 0
+    photo = msg.photo[-1]
+    cnt = await add_portfolio_photo(pid, photo.file_id, photo.file_unique_id) or 0
+    if cnt:
+        # Превью готовим сразу, а не при первом открытии Mini App
+        _spawn(thumbs.warm(photo.file_id))
     await msg.answer(f"Фото добавлено. Всего: {cnt}. Ещё или <b>готово</b>.")
 
 
@@ -980,6 +1383,34 @@ async def pf_photo_done(msg: Message, state: FSMContext):
         await msg.answer("Отправьте фото или напишите <b>готово</b>.")
 
 
+@router.callback_query(F.data.startswith("pf:phs:"))
+async def pf_photos(cb: CallbackQuery):
+    pid = int(cb.data.split(":")[2])
+    item = await get_portfolio_item(pid)
+    if not item or not item.photos:
+        await cb.answer("Фото нет", show_alert=True)
+        return
+    await cb.message.answer(f"<b>Фото работы #{pid}:</b> {len(item.photos)} шт.", reply_markup=kb_pf_photos(pid, len(item.photos)))
+    await cb.answer()
+
+
+@router.callback_query(F.data.startswith("pf:phdel:") | F.data.startswith("pf:phtop:"))
+async def pf_photo_edit(cb: CallbackQuery):
+    _, action, pid, idx = cb.data.split(":")
+    pid, idx = int(pid), int(idx)
+    if action == "phdel":
+        done = await remove_portfolio_photo(pid, idx)
+    else:
+        done = await reorder_portfolio_photos(pid, [idx])
+    if not done:
+        await cb.answer("Фото не найдено", show_alert=True)
+        return
+    item = await get_portfolio_item(pid)
+    cnt = len(item.photos) if item else 0
+    await safe_edit(cb.message, f"<b>Фото работы #{pid}:</b> {cnt} шт.", reply_markup=kb_pf_photos(pid, cnt))
+    await cb.answer("Удалено" if action == "phdel" else "Готово")
+
+
 @router.callback_query(F.data.startswith("pf:del:"))
 async def pf_delete(cb: CallbackQuery):
     pid = int(cb.data.split(":")[2])
@@ -1022,8 +1453,10 @@ async def mgr_any(msg: Message):
 @router.callback_query(F.data.startswith("cpay:"))
 async def confirm_pay(cb: CallbackQuery):
     oid = int(cb.data.split(":")[1])
-    await update_status(oid, "payment_confirmed")
-    order = await get_order(oid)
+    order = await update_status_returning(oid, "payment_confirmed")
+    if not order:
+        await cb.answer("Не найден", show_alert=True)
+        return
     try:
         await bot.send_message(order["user_id"], f"<b>Оплата #{oid} подтверждена!</b>")
     except Exception:
@@ -1041,8 +1474,10 @@ async def confirm_pay(cb: CallbackQuery):
 @router.callback_query(F.data.startswith("rpay:"))
 async def reject_pay(cb: CallbackQuery):
     oid = int(cb.data.split(":")[1])
-    await update_status(oid, "pending_payment")
-    order = await get_order(oid)
+    order = await update_status_returning(oid, "pending_payment")
+    if not order:
+        await cb.answer("Не найден", show_alert=True)
+        return
     try:
         await bot.send_message(order["user_id"], f"<b>Оплата #{oid} отклонена.</b>\nПроверьте реквизиты.")
     except Exception:
@@ -1061,8 +1496,10 @@ async def reject_pay(cb: CallbackQuery):
 async def set_status(cb: CallbackQuery):
     parts = cb.data.split(":")
     oid, ns = int(parts[1]), parts[2]
-    await update_status(oid, ns)
-    order = await get_order(oid)
+    order = await update_status_returning(oid, ns)
+    if not order:
+        await cb.answer("Не найден", show_alert=True)
+        return
     st = STATUS_NAMES.get(ns, ns)
     if ns == "in_progress":
         await set_active_order(order["user_id"], oid)
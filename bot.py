@@ -2,11 +2,11 @@
 Inside PC — Telegram бот (aiogram 3.25) + FastAPI в одном файле.
 
 Бот: /start, приём фото оплаты, чат с менеджером, статусы.
-API: POST /api/order, GET /api/status/{id}, GET /api/prices.
+API: POST /api/session, POST /api/order, GET /api/status/{id}, GET /api/prices.
+Пользователь API — из токена сессии (auth.py), а не из тела запроса.
 Статика Mini App раздаётся через FastAPI.
 """
 
-import json
 import logging
 from aiogram import Bot, Dispatcher, Router, F
 from aiogram.filters import CommandStart
@@ -17,13 +17,19 @@ from aiogram.types import (
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.client.default import DefaultBotProperties
-from fastapi import FastAPI, HTTPException
-from fastapi.staticfiles import StaticFiles
+from aiogram.exceptions import TelegramAPIError
+from fastapi import Depends, FastAPI, HTTPException, Header, Query, Request, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 from config import *
 from database import *
+import events
+from auth import AuthError, Sessions, user_dependency
+from fastjson import JSONResponse
+from idempotency import IdempotencyMismatch
+from ratelimit import RateLimitMiddleware, RateLimits, ThrottleMiddleware
+from static import StaticAssets
 
 log = logging.getLogger("insidepc")
 
@@ -31,13 +37,79 @@ log = logging.getLogger("insidepc")
 #                         FASTAPI
 # ============================================================
 
-app = FastAPI(title="Inside PC API")
+# Ответы сериализуются orjson (если установлен) — см. fastjson
+app = FastAPI(title="Inside PC API", default_response_class=JSONResponse)
+sessions = Sessions(BOT_TOKEN, SESSION_SECRET, SESSION_TTL, INIT_DATA_MAX_AGE, INIT_DATA_CACHE_SIZE)
+require_user = user_dependency(sessions)
+rate_limits = RateLimits(RATE_LIMITS, RATE_LIMIT_MAX_KEYS)
+# Добавлен раньше CORS — ответы 429 тоже получают CORS-заголовки
+app.add_middleware(RateLimitMiddleware, limits=rate_limits, identify=sessions.scope_user)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
-app.mount("/web", StaticFiles(directory="web", html=True), name="web")
+
+
+# Хуки общие для FastAPI и aiogram (dp.startup/dp.shutdown): в одном процессе
+# ресурсы открываются при первом старте и закрываются, когда остановились оба
+_running = 0
+
+
+@app.on_event("startup")
+async def on_startup():
+    global _running
+    _running += 1
+    if _running > 1:
+        return
+    web_assets.load()
+    await init_db()
+    notifier.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    global _running
+    _running -= 1
+    if _running > 0:
+        return
+    await notifier.stop()
+    await close_db()
+
+
+web_assets = StaticAssets("web", prefix="/web", dev=STATIC_DEV, max_age=STATIC_MAX_AGE)
+
+
+@app.get("/web")
+@app.get("/web/{path:path}")
+async def serve_web(request: Request, path: str = ""):
+    resp = web_assets.response(path, request.headers)
+    if resp is None:
+        raise HTTPException(404)
+    return resp
+
+
+def _can_see(uid, owner_id):
+    return uid == owner_id or uid in ADMIN_IDS
+
+
+class SessionIn(BaseModel):
+    init_data: str
+
+
+@app.post("/api/session")
+async def api_session(data: SessionIn):
+    """Проверенная initData Mini App -> токен сессии для остальных запросов."""
+    try:
+        user = sessions.verify_init_data(data.init_data)
+    except AuthError as e:
+        raise HTTPException(401, str(e))
+    uid = int(user["id"])
+    full_name = " ".join(filter(None, (user.get("first_name"), user.get("last_name"))))
+    await upsert_user(uid, user.get("username") or "", full_name)
+    token, expires = sessions.issue(uid)
+    return {"token": token, "expires_at": expires, "user_id": uid}
 
 
 class OrderIn(BaseModel):
-    user_id: int
+    # Устарели и не используются: пользователь и его профиль — из сессии (/api/session)
+    user_id: int = 0
     username: str = ""
     full_name: str = ""
     service_type: str
@@ -47,35 +119,40 @@ class OrderIn(BaseModel):
 
 
 @app.post("/api/order")
-async def api_create_order(data: OrderIn):
-    """Mini App отправляет сюда данные заявки."""
+async def api_create_order(data: OrderIn, response: Response, uid: int = Depends(require_user),
+                           idempotency_key: str | None = Header(None, alias="Idempotency-Key")):
+    """Mini App отправляет сюда данные заявки. Повтор с тем же Idempotency-Key заказ не дублирует."""
     if data.service_type not in PRICES:
         raise HTTPException(400, "Неизвестная услуга")
 
-    p = PRICES[data.service_type]
-    await upsert_user(data.user_id, data.username, data.full_name)
-
-    oid = await create_order(
-        data.user_id, data.service_type, data.has_parts_list,
-        data.parts_data, data.description, p["byn"], p["rub"]
-    )
+    async def create():
+        p = PRICES[data.service_type]
+        # Уведомления ставятся в outbox вместе с заказом и уходят в фоне
+        order = await create_order_returning(
+            uid, data.service_type, data.has_parts_list,
+            data.parts_data, data.description, p["byn"], p["rub"],
+            notify=("user_invoice", "manager_alert"),
+        )
+        return {"id": order["id"], "status": order["status"], "price_byn": p["byn"], "price_rub": p["rub"]}
 
-    # Уведомляем через бота
+    if not idempotency_key:
+        return await create()
+    fingerprint = data.model_dump(exclude={"user_id", "username", "full_name"})
     try:
-        await send_user_invoice(data.user_id, oid)
-        await send_manager_alert(oid, data.user_id)
-    except Exception as e:
-        log.error(f"Ошибка уведомления: {e}")
-
-    order = await get_order(oid)
-    return {"id": oid, "status": order["status"], "price_byn": p["byn"], "price_rub": p["rub"]}
+        result, replayed = await idempotency.run(f"{uid}:{idempotency_key}", fingerprint, create)
+    except IdempotencyMismatch:
+        raise HTTPException(422, "Idempotency-Key уже использован для другой заявки")
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
 
 
 @app.get("/api/status/{order_id}")
-async def api_status(order_id: int):
+async def api_status(order_id: int, uid: int = Depends(require_user)):
     """Статус заказа."""
     order = await get_order(order_id)
-    if not order:
+    # Чужой заказ неотличим от несуществующего
+    if not order or not _can_see(uid, order["user_id"]):
         raise HTTPException(404, "Заказ не найден")
     return {
         "order_id": order["id"],
@@ -85,9 +162,46 @@ async def api_status(order_id: int):
     }
 
 
+async def _event_topics(uid, order, user, all_orders):
+    """Темы подписки; чужие заказы и все заказы (all) — только менеджерам."""
+    if uid not in ADMIN_IDS:
+        if all_orders or any(u != uid for u in user):
+            raise HTTPException(403, "Нет доступа")
+        for oid in order:
+            o = await get_order(oid)
+            if not o or o["user_id"] != uid:
+                raise HTTPException(403, "Нет доступа")
+    topics = events.topics_from_query(order, user, all_orders)
+    if not topics:
+        raise HTTPException(400, "Укажите order, user или all")
+    return topics
+
+
+# Статусы и новые заказы приходят клиенту сами: ?order=<id>&user=<id>&all=1
+# EventSource не умеет заголовки — токен передаётся в ?access_token=
+@app.get("/api/events")
+async def api_events(request: Request, order: list[int] = Query([]), user: list[int] = Query([]),
+                     all_orders: bool = Query(False, alias="all"), uid: int = Depends(require_user)):
+    topics = await _event_topics(uid, order, user, all_orders)
+    return events.sse_response(topics, request.headers.get("last-event-id"))
+
+
+@app.websocket("/api/ws")
+async def api_ws(ws: WebSocket, order: list[int] = Query([]), user: list[int] = Query([]),
+                 all_orders: bool = Query(False, alias="all"), last_id: str | None = None,
+                 access_token: str | None = None):
+    try:
+        uid = sessions.user_id(access_token=access_token)
+        topics = await _event_topics(uid, order, user, all_orders)
+    except (AuthError, HTTPException):
+        await ws.close(code=1008)
+        return
+    await events.ws_serve(ws, topics, last_id)
+
+
 @app.get("/api/prices")
 async def api_prices():
-    return PRICES
+    return JSONResponse(PRICES)
 
 
 # ============================================================
@@ -98,6 +212,10 @@ bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
 dp = Dispatcher()
 router = Router()
 dp.include_router(router)
+router.message.middleware(ThrottleMiddleware(rate_limits["bot:message"]))
+router.callback_query.middleware(ThrottleMiddleware(rate_limits["bot:callback_query"]))
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
 
 
 # --- FSM ---
@@ -116,12 +234,19 @@ def kb_start():
     ])
 
 
-def kb_orders(orders):
+def kb_orders(orders, next_cursor=None, paged=False):
     rows = []
-    for o in orders[:10]:
+    for o in orders:
         s = STATUS_NAMES.get(o["status"], o["status"])
         n = PRICES.get(o["service_type"], {}).get("name", "?")
         rows.append([InlineKeyboardButton(text=f"#{o['id']} | {n} | {s}", callback_data=f"view:{o['id']}")])
+    nav = []
+    if paged:
+        nav.append(InlineKeyboardButton(text="В начало", callback_data="my_orders"))
+    if next_cursor:
+        nav.append(InlineKeyboardButton(text="Ещё", callback_data=f"my_orders:{next_cursor}"))
+    if nav:
+        rows.append(nav)
     rows.append([InlineKeyboardButton(text="Назад", callback_data="home")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
@@ -141,7 +266,7 @@ def kb_admin_manage(oid):
     ])
 
 
-# --- Уведомления (вызываются из API) ---
+# --- Уведомления (доставляются из outbox) ---
 async def send_user_invoice(uid, oid):
     """Отправляет пользователю реквизиты для оплаты."""
     order = await get_order(oid)
@@ -167,18 +292,25 @@ async def send_manager_alert(oid, uid):
     order = await get_order(oid)
     sn = PRICES[order["service_type"]]["name"]
 
-    # Создаём топик
-    try:
-        topic = await bot.create_forum_topic(MANAGER_GROUP_ID, f"Inside PC #{oid} | {sn}")
-        tid = topic.message_thread_id
-        await save_topic(tid, oid, uid)
-    except:
-        tid = None
+    # Создаём топик (при повторной доставке — берём уже созданный)
+    link = await get_topic_by_order(oid)
+    if link:
+        tid = link.topic_id
+    else:
+        try:
+            await rate_limits["bot:create_forum_topic"].acquire()
+            topic = await bot.create_forum_topic(MANAGER_GROUP_ID, f"Inside PC #{oid} | {sn}")
+            tid = topic.message_thread_id
+            await save_topic(tid, oid, uid)
+        except TelegramAPIError as e:
+            # Задание outbox не должно считаться доставленным: повтор с задержкой
+            log.error(f"topic: {e}")
+            raise
 
     # Формируем текст
     parts_text = ""
-    if order["has_parts"] and order["parts_data"]:
-        parts = json.loads(order["parts_data"])
+    if order.has_parts and order.parts:
+        parts = order.parts
         parts_text = "\n<b>Комплектующие:</b>\n" + "".join(
             f"  - {k}: {v}\n" for k, v in parts.items() if v
         )
@@ -199,6 +331,60 @@ async def send_manager_alert(oid, uid):
     await bot.send_message(**kwargs)
 
 
+async def _job_user_invoice(job):
+    order = await get_order(job["order_id"])
+    if order:
+        await send_user_invoice(order.user_id, order.id)
+
+
+async def _job_manager_alert(job):
+    order = await get_order(job["order_id"])
+    if order:
+        await send_manager_alert(order.id, order.user_id)
+
+
+async def _job_payment_confirmed(job):
+    order = await get_order(job["order_id"])
+    if not order:
+        return
+    await bot.send_message(
+        order.user_id,
+        f"<tg-emoji id=\"{E['ok']}\">_</tg-emoji> <b>Inside PC — Оплата заказа #{order.id} подтверждена!</b>\n"
+        f"Менеджер свяжется с вами в этом чате."
+    )
+
+
+async def _job_payment_rejected(job):
+    order = await get_order(job["order_id"])
+    if not order:
+        return
+    await bot.send_message(
+        order.user_id,
+        f"<tg-emoji id=\"{E['bell']}\">_</tg-emoji> <b>Inside PC — Оплата заказа #{order.id} не подтверждена.</b>\n"
+        f"Проверьте реквизиты и отправьте фото заново."
+    )
+
+
+async def _job_status_changed(job):
+    order = await get_order(job["order_id"])
+    if not order:
+        return
+    st_text = STATUS_NAMES.get(job["status"], job["status"])
+    await bot.send_message(
+        order.user_id,
+        f"<tg-emoji id=\"{E['bell']}\">_</tg-emoji> <b>Inside PC — Заказ #{order.id}</b>\nНовый статус: {st_text}"
+    )
+
+
+notifier = outbox_worker({
+    "user_invoice": _job_user_invoice,
+    "manager_alert": _job_manager_alert,
+    "payment_confirmed": _job_payment_confirmed,
+    "payment_rejected": _job_payment_rejected,
+    "status_changed": _job_status_changed,
+}, max_attempts=OUTBOX_MAX_ATTEMPTS, poll=OUTBOX_POLL)
+
+
 # --- Команда /start ---
 @router.message(CommandStart())
 async def cmd_start(msg: Message, state: FSMContext):
@@ -223,16 +409,18 @@ async def go_home(cb: CallbackQuery, state: FSMContext):
 
 
 # --- Мои заказы ---
-@router.callback_query(F.data == "my_orders")
+@router.callback_query(F.data.startswith("my_orders"))
 async def my_orders(cb: CallbackQuery):
-    orders = await get_user_orders(cb.from_user.id)
-    if not orders:
+    _, _, before = cb.data.partition(":")
+    before = int(before) if before else None
+    orders, next_cursor = await get_user_orders(cb.from_user.id, before=before)
+    if not orders and before is None:
         await cb.message.edit_text("У вас пока нет заказов.", reply_markup=kb_start())
         await cb.answer()
         return
     await cb.message.edit_text(
         f"<b><tg-emoji id=\"{E['doc']}\">_</tg-emoji> Ваши заказы:</b>",
-        reply_markup=kb_orders(orders)
+        reply_markup=kb_orders(orders, next_cursor, paged=before is not None)
     )
     await cb.answer()
 
@@ -370,13 +558,10 @@ async def manager_to_user(msg: Message):
 @router.callback_query(F.data.startswith("cpay:"))
 async def confirm_pay(cb: CallbackQuery):
     oid = int(cb.data.split(":")[1])
-    await update_status(oid, "payment_confirmed")
-    order = await get_order(oid)
-    await bot.send_message(
-        order["user_id"],
-        f"<tg-emoji id=\"{E['ok']}\">_</tg-emoji> <b>Inside PC — Оплата заказа #{oid} подтверждена!</b>\n"
-        f"Менеджер свяжется с вами в этом чате."
-    )
+    order = await update_status_returning(oid, "payment_confirmed", notify=("payment_confirmed",))
+    if not order:
+        await cb.answer("Не найден", show_alert=True)
+        return
     await cb.message.edit_caption(caption=f"<b>Inside PC — Заказ #{oid} — ОПЛАТА ПОДТВЕРЖДЕНА</b>")
     await cb.answer("Подтверждено")
 
@@ -384,13 +569,10 @@ async def confirm_pay(cb: CallbackQuery):
 @router.callback_query(F.data.startswith("rpay:"))
 async def reject_pay(cb: CallbackQuery):
     oid = int(cb.data.split(":")[1])
-    await update_status(oid, "pending_payment")
-    order = await get_order(oid)
-    await bot.send_message(
-        order["user_id"],
-        f"<tg-emoji id=\"{E['bell']}\">_</tg-emoji> <b>Inside PC — Оплата заказа #{oid} не подтверждена.</b>\n"
-        f"Проверьте реквизиты и отправьте фото заново."
-    )
+    order = await update_status_returning(oid, "pending_payment", notify=("payment_rejected",))
+    if not order:
+        await cb.answer("Не найден", show_alert=True)
+        return
     await cb.message.edit_caption(caption=f"<b>Inside PC — Заказ #{oid} — ОПЛАТА ОТКЛОНЕНА</b>")
     await cb.answer("Отклонено")
 
@@ -400,13 +582,11 @@ async def reject_pay(cb: CallbackQuery):
 async def set_status_cb(cb: CallbackQuery):
     parts = cb.data.split(":")
     oid, new_st = int(parts[1]), parts[2]
-    await update_status(oid, new_st)
-    order = await get_order(oid)
+    order = await update_status_returning(oid, new_st, notify=("status_changed",))
+    if not order:
+        await cb.answer("Не найден", show_alert=True)
+        return
     st_text = STATUS_NAMES.get(new_st, new_st)
 
-    await bot.send_message(
-        order["user_id"],
-        f"<tg-emoji id=\"{E['bell']}\">_</tg-emoji> <b>Inside PC — Заказ #{oid}</b>\nНовый статус: {st_text}"
-    )
     await cb.message.answer(f"Inside PC — Статус #{oid} изменён: {st_text}", reply_markup=kb_admin_manage(oid))
     await cb.answer(st_text)
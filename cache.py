@@ -0,0 +1,139 @@
+"""
+Inside PC — in-process кэши.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU-кэш с ограничением размера и временем жизни записей.
+
+    epoch растёт при каждой записи/инвалидации со стороны писателя.
+    Читатель запоминает epoch до похода в БД и кладёт результат через
+    set_if — если за это время была запись, устаревшая строка не попадёт в кэш.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.epoch = 0
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            self.misses += 1
+            return default
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _put(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def set(self, key, value):
+        """Запись от писателя: всегда кладёт и сдвигает epoch."""
+        self.epoch += 1
+        self._put(key, value)
+
+    def set_if(self, key, value, epoch):
+        """Запись от читателя: только если с момента чтения не было записей."""
+        if epoch == self.epoch:
+            self._put(key, value)
+
+    def pop(self, key):
+        """Инвалидация ключа."""
+        self.epoch += 1
+        self._data.pop(key, None)
+
+    def clear(self):
+        self.epoch += 1
+        self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data), "maxsize": self.maxsize,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class TopicIndex:
+    """
+    Двусторонний индекс топиков менеджеров в памяти:
+    topic_id -> TopicLink и order_id -> topic_id.
+    Загружается из topic_links при старте и обновляется в save_topic.
+    """
+
+    def __init__(self):
+        self._by_topic = {}
+        self._by_order = {}
+
+    def __len__(self):
+        return len(self._by_topic)
+
+    def load(self, links):
+        self._by_topic.clear()
+        self._by_order.clear()
+        for link in links:
+            self.put(link)
+
+    def put(self, link):
+        old = self._by_topic.get(link.topic_id)
+        if old and self._by_order.get(old.order_id) == link.topic_id:
+            del self._by_order[old.order_id]
+        self._by_topic[link.topic_id] = link
+        self._by_order[link.order_id] = link.topic_id
+
+    def by_topic(self, topic_id):
+        return self._by_topic.get(topic_id)
+
+    def by_order(self, order_id):
+        topic_id = self._by_order.get(order_id)
+        return self._by_topic.get(topic_id) if topic_id is not None else None
+
+
+class Snapshot:
+    """
+    Материализованный результат build(), пересобираемый только когда
+    меняется version() источника. Конкурентные читатели ждут одну сборку.
+    """
+
+    def __init__(self, build, version):
+        self._build = build
+        self._version = version
+        self._lock = asyncio.Lock()
+        self._built_for = None
+        self.value = None
+        self.builds = 0
+
+    async def get(self):
+        if self._built_for != self._version():
+            async with self._lock:
+                # Версию фиксируем до сборки: запись во время build() вызовет ещё одну
+                version = self._version()
+                if self._built_for != version:
+                    self.value = await self._build()
+                    self._built_for = version
+                    self.builds += 1
+        return self.value
@@ -8,6 +8,20 @@ BOT_TOKEN = os.getenv("BOT_TOKEN", "СЮДА_ТОКЕН_БОТА")
 ADMIN_CHAT_ID = int(os.getenv("ADMIN_CHAT_ID", "0"))
 MANAGER_GROUP_ID = int(os.getenv("MANAGER_GROUP_ID", "0"))
 WEBAPP_URL = os.getenv("WEBAPP_URL", "https://yourdomain.com/web")
+# Файловый сервер Bot API (для тестов можно указать локальную заглушку)
+TELEGRAM_FILE_BASE = os.getenv("TELEGRAM_FILE_BASE", "https://api.telegram.org/file")
+FILE_PATH_TTL = 3300          # сек; ссылка на файл живёт не меньше часа
+FILE_PATH_CACHE_SIZE = 10000  # file_id -> file_path в памяти
+FILE_RESOLVE_CONCURRENCY = 8  # одновременных getFile
+FILE_RESOLVE_BATCH_MAX = 100  # file_id в одном запросе /api/files/resolve
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "media_cache")
+MEDIA_CACHE_MAX_BYTES = 512 * 1024 * 1024
+MEDIA_MAX_AGE = 365 * 24 * 3600  # сек; file_id неизменяем — кэш у клиента навсегда
+THUMB_WIDTHS = (320, 640, 1280)  # ширины WebP-версий фото портфолио (srcset)
+THUMB_QUALITY = 80
+THUMB_WORKERS = 2                # процессов для кодирования
+STATIC_DEV = os.getenv("STATIC_DEV", "") == "1"  # перечитывать web/ при изменении файлов
+STATIC_MAX_AGE = 365 * 24 * 3600                 # сек для адресов с хэшем содержимого
 
 # API
 API_HOST = "0.0.0.0"
@@ -15,6 +29,50 @@ API_PORT = 8080
 
 # БД
 DATABASE_PATH = "insidepc.db"
+DB_POOL_READERS = 4  # соединений на чтение (+1 писатель)
+
+# Профиль SQLite — применяется к каждому соединению пула
+DB_PRAGMAS = {
+    "busy_timeout": 5000,            # мс ждать блокировку вместо "database is locked"
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,            # отрицательное — в КиБ (~16 МБ)
+    "mmap_size": 64 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+DB_CHECKPOINT_INTERVAL = 300  # сек между wal_checkpoint(PASSIVE), 0 — выкл
+DB_GROUP_COMMIT_MS = 5        # окно сбора записей в одну транзакцию
+DB_GROUP_COMMIT_MAX = 100     # максимум операций в одной транзакции
+ORDER_CACHE_SIZE = 4096       # заказов в памяти
+ORDER_CACHE_TTL = 600         # сек
+USER_CACHE_SIZE = 50000       # профилей пользователей в памяти
+USER_CACHE_TTL = 3600         # сек
+ORDERS_PAGE_SIZE = 10         # заказов на странице истории
+OUTBOX_MAX_ATTEMPTS = 8       # попыток доставки уведомления
+OUTBOX_POLL = 5               # сек между опросами outbox, если не разбудили
+IDEMPOTENCY_TTL = 24 * 3600   # сек хранения ответа по Idempotency-Key
+
+# Ограничение частоты — token bucket на пользователя (или IP) и маршрут:
+# (токенов в секунду, ёмкость ведра). HTTP — "МЕТОД /префикс пути",
+# проверяются сверху вниз; бот — "bot:<тип апдейта>" (только личные чаты).
+RATE_LIMITS = {
+    "POST /api/order": (1 / 10, 3),        # заявка раз в 10 с, до 3 подряд
+    "GET /api/orders/": (2, 20),
+    "GET /api/events": (0.5, 5),           # переподключения SSE
+    "POST /api/session": (0.2, 5),         # обмен initData на токен — по IP
+    "* /api/": (10, 50),
+    "bot:message": (1, 10),                # ёмкость 10 — альбом из 10 фото
+    "bot:callback_query": (2, 10),
+    "bot:create_forum_topic": (0.3, 5),    # исходящие вызовы — общий лимит бота
+}
+RATE_LIMIT_MAX_KEYS = 100000  # ведер на правило в памяти
+
+# Сессии Mini App (auth.py)
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()}  # менеджеры: admin.html, все заказы
+SESSION_SECRET = os.getenv("SESSION_SECRET", "")  # пусто — ключ выводится из BOT_TOKEN
+SESSION_TTL = 3600             # сек жизни токена сессии
+INIT_DATA_MAX_AGE = 24 * 3600  # сек; более старая initData не принимается
+INIT_DATA_CACHE_SIZE = 10000   # проверенных initData в LRU
 
 # Реквизиты оплаты
 PAYMENT_CARD = "1234 5678 9012 3456"
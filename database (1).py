@@ -2,170 +2,224 @@
 Inside PC — SQLite.
 + Портфолио
 """
-import aiosqlite
 import json
-from config import DATABASE_PATH
+import time
+from config import (
+    DATABASE_PATH, DB_POOL_READERS, DB_PRAGMAS, DB_CHECKPOINT_INTERVAL,
+    DB_GROUP_COMMIT_MS, DB_GROUP_COMMIT_MAX, ORDER_CACHE_SIZE, ORDER_CACHE_TTL,
+    USER_CACHE_SIZE, USER_CACHE_TTL, ORDERS_PAGE_SIZE, IDEMPOTENCY_TTL,
+)
+from cache import TTLCache, TopicIndex
+from db_pool import Pool
+from idempotency import Idempotency
+from migrations import migrate
+from models import Order, OrderSummary, User, PortfolioItem, TopicLink, columns, width
+import events
+import outbox
+
+_pool = Pool(
+    DATABASE_PATH, readers=DB_POOL_READERS,
+    pragmas=DB_PRAGMAS, checkpoint_interval=DB_CHECKPOINT_INTERVAL,
+    group_window_ms=DB_GROUP_COMMIT_MS, group_max=DB_GROUP_COMMIT_MAX,
+)
+_orders = TTLCache(ORDER_CACHE_SIZE, ORDER_CACHE_TTL)
+_topics = TopicIndex()
+_users = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+# Растёт при каждой записи в портфолио — по нему пересобирается лента
+_portfolio_rev = 0
 
 
 async def init_db():
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                full_name TEXT,
-                active_order INTEGER DEFAULT 0
-            )
-        """)
-        for col, default in [("active_order", "0")]:
-            try:
-                await db.execute(f"ALTER TABLE users ADD COLUMN {col} INTEGER DEFAULT {default}")
-                await db.commit()
-            except Exception:
-                pass
-
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                service_type TEXT NOT NULL,
-                has_parts INTEGER DEFAULT 0,
-                parts_data TEXT,
-                description TEXT,
-                status TEXT DEFAULT 'pending_payment',
-                payment_photo TEXT,
-                topic_id INTEGER,
-                price_byn REAL,
-                price_rub REAL,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+    await _pool.open()
+    async with _pool.writer() as db:
+        await migrate(db)
+        cur = await db.execute(f"SELECT {TopicLink.COLUMNS} FROM topic_links")
+        _topics.load(TopicLink(*r) for r in await cur.fetchall())
 
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS topic_links (
-                topic_id INTEGER PRIMARY KEY,
-                order_id INTEGER,
-                user_id INTEGER
-            )
-        """)
-
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS portfolio (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT DEFAULT '',
-                description TEXT DEFAULT '',
-                specs TEXT DEFAULT '',
-                price_byn REAL DEFAULT 0,
-                price_rub REAL DEFAULT 0,
-                photo_ids TEXT DEFAULT '[]',
-                category TEXT DEFAULT '',
-                is_visible INTEGER DEFAULT 1,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
 
-        await db.commit()
+async def close_db():
+    await _pool.close()
+
+
+def outbox_worker(handlers, **kw):
+    return outbox.OutboxWorker(_pool, handlers, **kw)
+
+
+def db_stats():
+    return {**_pool.stats(), "order_cache": _orders.stats(), "topics": len(_topics),
+            "user_cache": _users.stats()}
 
 
 # ============================================================
 #  USERS
 # ============================================================
 
+async def _write_user(sql, params):
+    user = await _pool.write_returning(f"{sql} RETURNING {User.COLUMNS}", params, User)
+    if user:
+        _users.set(user.user_id, user)
+    return user
+
+
 async def upsert_user(uid, username, full_name):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("""
-            INSERT INTO users (user_id, username, full_name)
-            VALUES (?, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET username=?, full_name=?
-        """, (uid, username, full_name, username, full_name))
-        await db.commit()
+    """Пишет в БД только если профиль изменился (или пользователя нет в кэше)."""
+    user = _users.get(uid)
+    if user and user.username == username and user.full_name == full_name:
+        return
+    await _write_user("""
+        INSERT INTO users (user_id, username, full_name)
+        VALUES (?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET username=?, full_name=?
+    """, (uid, username, full_name, username, full_name))
 
 
 async def get_user(uid):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute("SELECT * FROM users WHERE user_id=?", (uid,))
-        row = await cur.fetchone()
-        return dict(row) if row else None
+    user = _users.get(uid)
+    if user is None:
+        epoch = _users.epoch
+        user = await _pool.fetchone(f"SELECT {User.COLUMNS} FROM users WHERE user_id=?", (uid,), User)
+        if user is None:
+            return None
+        _users.set_if(uid, user, epoch)
+    return user
 
 
 async def set_active_order(uid, oid):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("UPDATE users SET active_order=? WHERE user_id=?", (oid, uid))
-        await db.commit()
+    await _write_user("UPDATE users SET active_order=? WHERE user_id=?", (oid, uid))
 
 
 async def get_active_order(uid):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        cur = await db.execute("SELECT active_order FROM users WHERE user_id=?", (uid,))
-        row = await cur.fetchone()
-        return row[0] if row and row[0] else None
+    user = await get_user(uid)
+    return user.active_order if user and user.active_order else None
 
 
 # ============================================================
 #  ORDERS
 # ============================================================
 
-async def create_order(uid, service, has_parts, parts, desc, byn, rub, status="pending_payment"):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        cur = await db.execute(
-            "INSERT INTO orders (user_id, service_type, has_parts, parts_data, "
-            "description, price_byn, price_rub, status) VALUES (?,?,?,?,?,?,?,?)",
-            (uid, service, int(has_parts),
-             json.dumps(parts, ensure_ascii=False) if parts else None,
-             desc, byn, rub, status),
-        )
-        await db.commit()
-        return cur.lastrowid
+async def _write_order(sql, params, notify=(), event="order_updated"):
+    """
+    INSERT/UPDATE ... RETURNING по заказу; свежая строка кладётся в кэш после коммита.
+    notify — виды заданий outbox, которые ставятся в той же транзакции.
+    event — тип события для подписчиков (events), публикуется после коммита.
+    """
+    async def op(db):
+        cur = await db.execute(f"{sql} RETURNING {Order.COLUMNS}", params)
+        rows = await cur.fetchall()
+        if not rows:
+            return None
+        order = Order(*rows[0])
+        for kind in notify:
+            await outbox.enqueue(
+                db, kind, {"order_id": order.id, "status": order.status},
+                f"{kind}:{order.id}:{order.status}",
+            )
+        return order
+    order = await _pool.write(op)
+    if order:
+        _orders.set(order.id, order)
+        if notify:
+            outbox.wake()
+        events.broker.publish(events.order_topics(order), {
+            "type": event, "order_id": order.id, "user_id": order.user_id, "status": order.status,
+            "status_text": STATUS_NAMES.get(order.status, order.status),
+            "price_byn": order.price_byn, "price_rub": order.price_rub,
+        })
+    return order
+
+
+async def create_order(uid, service, has_parts, parts, desc, byn, rub, status="pending_payment", notify=()):
+    order = await create_order_returning(uid, service, has_parts, parts, desc, byn, rub, status, notify)
+    return order.id
+
+
+async def create_order_returning(uid, service, has_parts, parts, desc, byn, rub, status="pending_payment",
+                                 notify=()):
+    return await _write_order(
+        "INSERT INTO orders (user_id, service_type, has_parts, parts_data, "
+        "description, price_byn, price_rub, status) VALUES (?,?,?,?,?,?,?,?)",
+        (uid, service, int(has_parts),
+         json.dumps(parts, ensure_ascii=False) if parts else None,
+         desc, byn, rub, status),
+        notify, "order_created",
+    )
 
 
 async def get_order(oid):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute("SELECT * FROM orders WHERE id=?", (oid,))
-        row = await cur.fetchone()
-        return dict(row) if row else None
-
-
-async def get_user_orders(uid):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute(
-            "SELECT * FROM orders WHERE user_id=? ORDER BY created_at DESC", (uid,),
-        )
-        return [dict(r) for r in await cur.fetchall()]
+    order = _orders.get(oid)
+    if order is None:
+        epoch = _orders.epoch
+        order = await _pool.fetchone(f"SELECT {Order.COLUMNS} FROM orders WHERE id=?", (oid,), Order)
+        if order is None:
+            return None
+        _orders.set_if(oid, order, epoch)
+    return order
+
+
+async def get_order_with_user(oid):
+    """(Order, User | None) — из кэшей или одним JOIN."""
+    order = _orders.get(oid)
+    user = _users.get(order.user_id) if order else None
+    if user is not None:
+        return order, user
+    epochs = _orders.epoch, _users.epoch
+    row = await _pool.fetchone(
+        f"SELECT {columns(Order, 'o')}, {columns(User, 'u')} FROM orders o "
+        "LEFT JOIN users u ON u.user_id=o.user_id WHERE o.id=?", (oid,),
+    )
+    if row is None:
+        return None, None
+    n = width(Order)
+    order = Order(*row[:n])
+    user = User(*row[n:]) if row[n] is not None else None
+    _orders.set_if(oid, order, epochs[0])
+    if user:
+        _users.set_if(user.user_id, user, epochs[1])
+    return order, user
+
+
+async def get_user_orders(uid, limit=ORDERS_PAGE_SIZE, before=None):
+    sql = f"SELECT {OrderSummary.COLUMNS} FROM orders WHERE user_id=?"
+    params = [uid]
+    if before is not None:
+        sql += " AND (created_at, id) < (SELECT created_at, id FROM orders WHERE id=?)"
+        params.append(before)
+    rows = await _pool.fetchall(f"{sql} ORDER BY created_at DESC, id DESC LIMIT ?", (*params, limit + 1), OrderSummary)
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].id
+    return rows, None
+
+
+async def get_user_order_counts(uid):
+    """Число заказов пользователя по статусам: {status: n}."""
+    rows = await _pool.fetchall("SELECT status, COUNT(*) FROM orders WHERE user_id=? GROUP BY status", (uid,))
+    return {status: n for status, n in rows}
 
 
 async def get_latest_pending_order(uid):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute(
-            "SELECT * FROM orders WHERE user_id=? AND status='pending_payment' "
-            "ORDER BY created_at DESC LIMIT 1", (uid,),
-        )
-        row = await cur.fetchone()
-        return dict(row) if row else None
+    return await _pool.fetchone(
+        f"SELECT {Order.COLUMNS} FROM orders WHERE user_id=? AND status='pending_payment' "
+        "ORDER BY created_at DESC LIMIT 1", (uid,), Order,
+    )
 
 
 async def update_status(oid, status):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("UPDATE orders SET status=? WHERE id=?", (status, oid))
-        await db.commit()
+    await update_status_returning(oid, status)
+
+
+async def update_status_returning(oid, status, notify=()):
+    return await _write_order("UPDATE orders SET status=? WHERE id=?", (status, oid), notify)
 
 
 async def set_order_price(order_id, price_byn, price_rub):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute(
-            "UPDATE orders SET price_byn=?, price_rub=?, status='pending_payment' WHERE id=?",
-            (price_byn, price_rub, order_id),
-        )
-        await db.commit()
+    await _write_order(
+        "UPDATE orders SET price_byn=?, price_rub=?, status='pending_payment' WHERE id=?",
+        (price_byn, price_rub, order_id),
+    )
 
 
 async def save_payment_photo(oid, file_id):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("UPDATE orders SET payment_photo=? WHERE id=?", (file_id, oid))
-        await db.commit()
+    await _write_order("UPDATE orders SET payment_photo=? WHERE id=?", (file_id, oid))
 
 
 # ============================================================
@@ -173,98 +227,223 @@ async def save_payment_photo(oid, file_id):
 # ============================================================
 
 async def save_topic(topic_id, order_id, user_id):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async def op(db):
         await db.execute("INSERT OR REPLACE INTO topic_links VALUES (?,?,?)", (topic_id, order_id, user_id))
-        await db.execute("UPDATE orders SET topic_id=? WHERE id=?", (topic_id, order_id))
-        await db.commit()
+        cur = await db.execute(
+            f"UPDATE orders SET topic_id=? WHERE id=? RETURNING {Order.COLUMNS}", (topic_id, order_id),
+        )
+        rows = await cur.fetchall()
+        return Order(*rows[0]) if rows else None
+    order = await _pool.write(op)
+    if order:
+        _orders.set(order_id, order)
+    _topics.put(TopicLink(topic_id, order_id, user_id))
 
 
 async def get_topic_link(topic_id):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute("SELECT * FROM topic_links WHERE topic_id=?", (topic_id,))
-        row = await cur.fetchone()
-        return dict(row) if row else None
+    return _topics.by_topic(topic_id)
 
 
 async def get_topic_by_order(oid):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute("SELECT * FROM topic_links WHERE order_id=?", (oid,))
-        row = await cur.fetchone()
-        return dict(row) if row else None
+    return _topics.by_order(oid)
 
 
 # ============================================================
 #  PORTFOLIO
 # ============================================================
 
+def portfolio_version():
+    return _portfolio_rev
+
+
+async def _portfolio_write(op):
+    global _portfolio_rev
+    res = await _pool.write(op)
+    _portfolio_rev += 1
+    return res
+
+
 async def add_portfolio_item(title="", description="", specs="", price_byn=0, price_rub=0, category=""):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async def op(db):
         cur = await db.execute(
             "INSERT INTO portfolio (title, description, specs, price_byn, price_rub, category) "
             "VALUES (?,?,?,?,?,?)",
             (title, description, specs, price_byn, price_rub, category),
         )
-        await db.commit()
         return cur.lastrowid
+    return await _portfolio_write(op)
 
 
 async def get_portfolio_item(pid):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute("SELECT * FROM portfolio WHERE id=?", (pid,))
-        row = await cur.fetchone()
-        return dict(row) if row else None
+    return await _pool.fetchone(
+        f"SELECT {PortfolioItem.COLUMNS} FROM portfolio_items WHERE id=?", (pid,), PortfolioItem,
+    )
 
 
 async def get_portfolio_all():
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute("SELECT * FROM portfolio WHERE is_visible=1 ORDER BY created_at DESC")
-        return [dict(r) for r in await cur.fetchall()]
-
-
-async def update_portfolio(pid, **fields):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        for k, v in fields.items():
-            await db.execute(f"UPDATE portfolio SET {k}=? WHERE id=?", (v, pid))
-        await db.commit()
+    """Видимые работы вместе со списками фото — один запрос."""
+    return await _pool.fetchall(
+        f"SELECT {PortfolioItem.COLUMNS} FROM portfolio_items WHERE is_visible=1 ORDER BY created_at DESC",
+        (), PortfolioItem,
+    )
+
+
+# Поля работы, которые можно менять через update_portfolio
+PORTFOLIO_FIELDS = ("title", "description", "specs", "price_byn", "price_rub", "category", "is_visible")
+
+
+class VersionConflict(Exception):
+    """Запись изменилась после того, как клиент её прочитал."""
+
+    def __init__(self, pid, version):
+        super().__init__(f"portfolio #{pid}: текущая версия {version}")
+        self.pid = pid
+        self.version = version
+
+
+def _set_clause(fields, allowed):
+    """'a=?, b=?' и значения — только для колонок из белого списка."""
+    bad = set(fields) - set(allowed)
+    if bad:
+        raise ValueError(f"Недопустимые поля: {', '.join(sorted(bad))}")
+    return ", ".join(f"{k}=?" for k in fields), list(fields.values())
+
+
+async def _update_portfolio(db, pid, version, fields):
+    sets, params = _set_clause(fields, PORTFOLIO_FIELDS)
+    sql = f"UPDATE portfolio SET {sets}, version=version+1 WHERE id=?"
+    params.append(pid)
+    if version is not None:
+        sql += " AND version=?"
+        params.append(version)
+    cur = await db.execute(f"{sql} RETURNING version", params)
+    row = await cur.fetchone()
+    if row:
+        return row[0]
+    if version is not None:
+        cur = await db.execute("SELECT version FROM portfolio WHERE id=?", (pid,))
+        current = await cur.fetchone()
+        if current:
+            raise VersionConflict(pid, current[0])
+    return None
+
+
+async def update_portfolio(pid, version=None, **fields):
+    """
+    Меняет переданные поля одним UPDATE. version — ожидаемая версия:
+    если запись уже изменили, VersionConflict. Возвращает новую версию
+    (None — работы нет).
+    """
+    if not fields:
+        item = await get_portfolio_item(pid)
+        return item.version if item else None
+    return await _portfolio_write(lambda db: _update_portfolio(db, pid, version, fields))
+
+
+async def update_portfolio_many(updates):
+    """
+    Пакетное изменение: [{"id": .., "version": .., поле: значение, ...}].
+    Одна транзакция — при конфликте версии не применяется ничего.
+    Возвращает {id: новая версия} (без несуществующих работ).
+    """
+    updates = [dict(u) for u in updates]
+
+    async def op(db):
+        out = {}
+        for u in updates:
+            pid, version = u.pop("id"), u.pop("version", None)
+            new = await _update_portfolio(db, pid, version, u) if u else None
+            if new is not None:
+                out[pid] = new
+        return out
+    return await _portfolio_write(op)
 
 
 async def delete_portfolio(pid):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async def op(db):
+        await db.execute("DELETE FROM portfolio_photos WHERE item_id=?", (pid,))
         await db.execute("DELETE FROM portfolio WHERE id=?", (pid,))
-        await db.commit()
+    await _portfolio_write(op)
 
 
-async def add_portfolio_photo(pid, file_id):
-    item = await get_portfolio_item(pid)
-    if not item:
-        return
-    try:
-        photos = json.loads(item["photo_ids"])
-    except Exception:
-        photos = []
-    photos.append(file_id)
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("UPDATE portfolio SET photo_ids=? WHERE id=?", (json.dumps(photos), pid))
-        await db.commit()
+async def add_portfolio_photo(pid, file_id, file_unique_id=None):
+    """Дописывает фото в конец списка. Возвращает число фото (None — нет работы)."""
+    async def op(db):
+        cur = await db.execute(
+            "INSERT INTO portfolio_photos (item_id, position, file_id, file_unique_id) "
+            "SELECT id, (SELECT COALESCE(MAX(position)+1, 0) FROM portfolio_photos WHERE item_id=?1), ?2, ?3 "
+            "FROM portfolio WHERE id=?1", (pid, file_id, file_unique_id),
+        )
+        if not cur.rowcount:
+            return None
+        cur = await db.execute("SELECT COUNT(*) FROM portfolio_photos WHERE item_id=?", (pid,))
+        return (await cur.fetchone())[0]
+    return await _portfolio_write(op)
 
 
 async def remove_portfolio_photo(pid, index):
-    item = await get_portfolio_item(pid)
-    if not item:
-        return
-    try:
-        photos = json.loads(item["photo_ids"])
-    except Exception:
-        photos = []
-    if 0 <= index < len(photos):
-        photos.pop(index)
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("UPDATE portfolio SET photo_ids=? WHERE id=?", (json.dumps(photos), pid))
-        await db.commit()
+    """Удаляет фото по порядковому номеру (с 0). True — удалено."""
+    async def op(db):
+        cur = await db.execute(
+            "DELETE FROM portfolio_photos WHERE id=("
+            "SELECT id FROM portfolio_photos WHERE item_id=? ORDER BY position LIMIT 1 OFFSET ?)",
+            (pid, index),
+        )
+        return cur.rowcount > 0
+    return await _portfolio_write(op)
+
+
+async def reorder_portfolio_photos(pid, order):
+    """
+    Переставляет фото: order — текущие номера фото в новом порядке,
+    например [2, 0, 1]. Не перечисленные фото уходят в конец.
+    Возвращает число переставленных фото; 0 — номер вне диапазона, ничего не менялось.
+    """
+    indexes = list(dict.fromkeys(int(i) for i in order))
+    order = json.dumps(indexes)
+
+    async def op(db):
+        cur = await db.execute("SELECT COUNT(*) FROM portfolio_photos WHERE item_id=?", (pid,))
+        count = (await cur.fetchone())[0]
+        if any(not 0 <= i < count for i in indexes):
+            return 0
+        cur = await db.execute(
+            "UPDATE portfolio_photos SET position=o.pos FROM ("
+            " SELECT ph.id, COALESCE(j.key, json_array_length(?2) + ph.idx) AS pos FROM ("
+            "  SELECT id, ROW_NUMBER() OVER (ORDER BY position) - 1 AS idx FROM portfolio_photos WHERE item_id=?1"
+            " ) ph LEFT JOIN json_each(?2) j ON j.value=ph.idx"
+            ") o WHERE portfolio_photos.id=o.id", (pid, order),
+        )
+        return cur.rowcount
+    return await _portfolio_write(op)
+
+
+# ============================================================
+#  ИДЕМПОТЕНТНОСТЬ
+# ============================================================
+
+async def load_idempotent(key):
+    """(fingerprint, ответ) по Idempotency-Key или None, если нет/истёк."""
+    row = await _pool.fetchone(
+        "SELECT fingerprint, response FROM idempotency_keys WHERE key=? AND expires_at>?", (key, time.time()),
+    )
+    return (row[0], json.loads(row[1])) if row else None
+
+
+async def save_idempotent(key, fingerprint, response, ttl):
+    """Сохраняет ответ по ключу и заодно чистит истёкшие ключи."""
+    now = time.time()
+
+    async def op(db):
+        await db.execute("DELETE FROM idempotency_keys WHERE expires_at<=?", (now,))
+        await db.execute(
+            "INSERT OR REPLACE INTO idempotency_keys (key, fingerprint, response, expires_at) VALUES (?,?,?,?)",
+            (key, fingerprint, json.dumps(response, ensure_ascii=False), now + ttl),
+        )
+    await _pool.write(op)
+
+
+idempotency = Idempotency(load_idempotent, save_idempotent, ttl=IDEMPOTENCY_TTL)
 
 
 # ============================================================
@@ -278,4 +457,4 @@ STATUS_NAMES = {
     "in_progress": "В работе",
     "completed": "Завершён",
     "cancelled": "Отменён",
-}
\ No newline at end of file
+}
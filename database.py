@@ -1,123 +1,252 @@
 """
 Inside PC — вся работа с SQLite.
 """
-import aiosqlite
 import json
-from config import DATABASE_PATH
+import time
+from config import (
+    DATABASE_PATH, DB_POOL_READERS, DB_PRAGMAS, DB_CHECKPOINT_INTERVAL,
+    DB_GROUP_COMMIT_MS, DB_GROUP_COMMIT_MAX, ORDER_CACHE_SIZE, ORDER_CACHE_TTL,
+    USER_CACHE_SIZE, USER_CACHE_TTL, ORDERS_PAGE_SIZE, IDEMPOTENCY_TTL,
+)
+from cache import TTLCache, TopicIndex
+from db_pool import Pool
+from idempotency import Idempotency
+from migrations import migrate
+from models import Order, OrderSummary, User, TopicLink, columns, width
+import events
+import outbox
+
+_pool = Pool(
+    DATABASE_PATH, readers=DB_POOL_READERS,
+    pragmas=DB_PRAGMAS, checkpoint_interval=DB_CHECKPOINT_INTERVAL,
+    group_window_ms=DB_GROUP_COMMIT_MS, group_max=DB_GROUP_COMMIT_MAX,
+)
+# Строки заказов по id; обновляются каждым путём записи
+_orders = TTLCache(ORDER_CACHE_SIZE, ORDER_CACHE_TTL)
+# topic_links целиком в памяти: пересылка сообщений не ходит в БД
+_topics = TopicIndex()
+# Профили пользователей: upsert_user не пишет, если ничего не поменялось
+_users = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
 
 
 async def init_db():
-    """Создаёт таблицы при первом запуске."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                full_name TEXT
-            )
-        """)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                service_type TEXT NOT NULL,
-                has_parts INTEGER DEFAULT 0,
-                parts_data TEXT,
-                description TEXT,
-                status TEXT DEFAULT 'pending_payment',
-                payment_photo TEXT,
-                topic_id INTEGER,
-                price_byn REAL,
-                price_rub REAL,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS topic_links (
-                topic_id INTEGER PRIMARY KEY,
-                order_id INTEGER,
-                user_id INTEGER
-            )
-        """)
-        await db.commit()
+    """Открывает пул и применяет миграции схемы."""
+    await _pool.open()
+    async with _pool.writer() as db:
+        await migrate(db)
+        cur = await db.execute(f"SELECT {TopicLink.COLUMNS} FROM topic_links")
+        _topics.load(TopicLink(*r) for r in await cur.fetchall())
+
+
+async def close_db():
+    """Закрывает пул при остановке приложения."""
+    await _pool.close()
+
+
+def outbox_worker(handlers, **kw):
+    """Воркер доставки заданий outbox поверх пула соединений."""
+    return outbox.OutboxWorker(_pool, handlers, **kw)
+
+
+def db_stats():
+    """Статистика пула соединений и кэшей."""
+    return {**_pool.stats(), "order_cache": _orders.stats(), "topics": len(_topics),
+            "user_cache": _users.stats()}
 
 
 async def upsert_user(uid, username, full_name):
-    """Сохраняет или обновляет пользователя."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute(
-            "INSERT INTO users VALUES (?,?,?) ON CONFLICT(user_id) DO UPDATE SET username=?, full_name=?",
-            (uid, username, full_name, username, full_name)
-        )
-        await db.commit()
+    """Сохраняет или обновляет пользователя. Если профиль не менялся — без записи."""
+    user = _users.get(uid)
+    if user and user.username == username and user.full_name == full_name:
+        return
+    user = await _pool.write_returning(
+        "INSERT INTO users (user_id, username, full_name) VALUES (?,?,?) "
+        f"ON CONFLICT(user_id) DO UPDATE SET username=?, full_name=? RETURNING {User.COLUMNS}",
+        (uid, username, full_name, username, full_name), User
+    )
+    _users.set(uid, user)
+
+
+async def get_user(uid):
+    """Профиль пользователя (сначала из кэша)."""
+    user = _users.get(uid)
+    if user is None:
+        epoch = _users.epoch
+        user = await _pool.fetchone(f"SELECT {User.COLUMNS} FROM users WHERE user_id=?", (uid,), User)
+        if user is None:
+            return None
+        _users.set_if(uid, user, epoch)
+    return user
+
+
+async def _write_order(sql, params, notify=(), event="order_updated"):
+    """
+    INSERT/UPDATE ... RETURNING по заказу; свежая строка кладётся в кэш после коммита.
+    notify — виды заданий outbox, которые ставятся в той же транзакции.
+    event — тип события для подписчиков (events), публикуется после коммита.
+    """
+    async def op(db):
+        cur = await db.execute(f"{sql} RETURNING {Order.COLUMNS}", params)
+        rows = await cur.fetchall()
+        if not rows:
+            return None
+        order = Order(*rows[0])
+        for kind in notify:
+            await outbox.enqueue(
+                db, kind, {"order_id": order.id, "status": order.status},
+                f"{kind}:{order.id}:{order.status}",
+            )
+        return order
+    order = await _pool.write(op)
+    if order:
+        _orders.set(order.id, order)
+        if notify:
+            outbox.wake()
+        events.broker.publish(events.order_topics(order), {
+            "type": event, "order_id": order.id, "user_id": order.user_id, "status": order.status,
+            "status_text": STATUS_NAMES.get(order.status, order.status),
+            "price_byn": order.price_byn, "price_rub": order.price_rub,
+        })
+    return order
 
 
 async def create_order(uid, service, has_parts, parts, desc, byn, rub):
     """Создаёт заказ, возвращает его ID."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        cur = await db.execute(
-            "INSERT INTO orders (user_id,service_type,has_parts,parts_data,description,price_byn,price_rub) VALUES (?,?,?,?,?,?,?)",
-            (uid, service, int(has_parts), json.dumps(parts, ensure_ascii=False) if parts else None, desc, byn, rub)
-        )
-        await db.commit()
-        return cur.lastrowid
+    order = await create_order_returning(uid, service, has_parts, parts, desc, byn, rub)
+    return order.id
+
+
+async def create_order_returning(uid, service, has_parts, parts, desc, byn, rub, notify=()):
+    """Создаёт заказ и сразу возвращает его строку (одна операция)."""
+    return await _write_order(
+        "INSERT INTO orders (user_id,service_type,has_parts,parts_data,description,price_byn,price_rub) "
+        "VALUES (?,?,?,?,?,?,?)",
+        (uid, service, int(has_parts), json.dumps(parts, ensure_ascii=False) if parts else None, desc, byn, rub),
+        notify, "order_created",
+    )
 
 
 async def get_order(oid):
-    """Получает заказ по ID."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute("SELECT * FROM orders WHERE id=?", (oid,))
-        row = await cur.fetchone()
-        return dict(row) if row else None
+    """Получает заказ по ID (сначала из кэша)."""
+    order = _orders.get(oid)
+    if order is None:
+        epoch = _orders.epoch
+        order = await _pool.fetchone(f"SELECT {Order.COLUMNS} FROM orders WHERE id=?", (oid,), Order)
+        if order is None:
+            return None
+        _orders.set_if(oid, order, epoch)
+    return order
+
+
+async def get_order_with_user(oid):
+    """Заказ и профиль клиента: из кэшей или одним JOIN. Возвращает (Order, User | None)."""
+    order = _orders.get(oid)
+    user = _users.get(order.user_id) if order else None
+    if user is not None:
+        return order, user
+    epochs = _orders.epoch, _users.epoch
+    row = await _pool.fetchone(
+        f"SELECT {columns(Order, 'o')}, {columns(User, 'u')} FROM orders o "
+        "LEFT JOIN users u ON u.user_id=o.user_id WHERE o.id=?", (oid,)
+    )
+    if row is None:
+        return None, None
+    n = width(Order)
+    order = Order(*row[:n])
+    user = User(*row[n:]) if row[n] is not None else None
+    _orders.set_if(oid, order, epochs[0])
+    if user:
+        _users.set_if(user.user_id, user, epochs[1])
+    return order, user
+
 
+async def get_user_orders(uid, limit=ORDERS_PAGE_SIZE, before=None):
+    """
+    Страница истории заказов, новые сверху. before — next_cursor прошлой
+    страницы (id её последнего заказа). Возвращает (заказы, next_cursor);
+    next_cursor=None — это последняя страница.
+    """
+    sql = f"SELECT {OrderSummary.COLUMNS} FROM orders WHERE user_id=?"
+    params = [uid]
+    if before is not None:
+        sql += " AND (created_at, id) < (SELECT created_at, id FROM orders WHERE id=?)"
+        params.append(before)
+    rows = await _pool.fetchall(f"{sql} ORDER BY created_at DESC, id DESC LIMIT ?", (*params, limit + 1), OrderSummary)
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].id
+    return rows, None
 
-async def get_user_orders(uid):
-    """Все заказы пользователя."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute("SELECT * FROM orders WHERE user_id=? ORDER BY created_at DESC", (uid,))
-        return [dict(r) for r in await cur.fetchall()]
+
+async def get_user_order_counts(uid):
+    """Число заказов пользователя по статусам: {status: n}."""
+    rows = await _pool.fetchall("SELECT status, COUNT(*) FROM orders WHERE user_id=? GROUP BY status", (uid,))
+    return {status: n for status, n in rows}
 
 
 async def update_status(oid, status):
     """Обновляет статус заказа."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("UPDATE orders SET status=? WHERE id=?", (status, oid))
-        await db.commit()
+    await update_status_returning(oid, status)
+
+
+async def update_status_returning(oid, status, notify=()):
+    """Обновляет статус и возвращает обновлённый заказ (None — нет такого)."""
+    return await _write_order("UPDATE orders SET status=? WHERE id=?", (status, oid), notify)
 
 
 async def save_payment_photo(oid, file_id):
     """Сохраняет file_id фото оплаты."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("UPDATE orders SET payment_photo=?, status='payment_uploaded' WHERE id=?", (file_id, oid))
-        await db.commit()
+    await _write_order("UPDATE orders SET payment_photo=?, status='payment_uploaded' WHERE id=?", (file_id, oid))
 
 
 async def save_topic(topic_id, order_id, user_id):
     """Связывает топик группы с заказом."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async def op(db):
         await db.execute("INSERT OR REPLACE INTO topic_links VALUES (?,?,?)", (topic_id, order_id, user_id))
-        await db.execute("UPDATE orders SET topic_id=? WHERE id=?", (topic_id, order_id))
-        await db.commit()
+        cur = await db.execute(f"UPDATE orders SET topic_id=? WHERE id=? RETURNING {Order.COLUMNS}", (topic_id, order_id))
+        rows = await cur.fetchall()
+        return Order(*rows[0]) if rows else None
+    order = await _pool.write(op)
+    if order:
+        _orders.set(order_id, order)
+    _topics.put(TopicLink(topic_id, order_id, user_id))
 
 
 async def get_topic_link(topic_id):
     """Кто привязан к топику."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute("SELECT * FROM topic_links WHERE topic_id=?", (topic_id,))
-        row = await cur.fetchone()
-        return dict(row) if row else None
+    return _topics.by_topic(topic_id)
 
 
 async def get_topic_by_order(oid):
     """Топик по заказу."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute("SELECT * FROM topic_links WHERE order_id=?", (oid,))
-        row = await cur.fetchone()
-        return dict(row) if row else None
+    return _topics.by_order(oid)
+
+
+# ============================================================
+#  ИДЕМПОТЕНТНОСТЬ
+# ============================================================
+
+async def load_idempotent(key):
+    """(fingerprint, ответ) по Idempotency-Key или None, если нет/истёк."""
+    row = await _pool.fetchone(
+        "SELECT fingerprint, response FROM idempotency_keys WHERE key=? AND expires_at>?", (key, time.time()),
+    )
+    return (row[0], json.loads(row[1])) if row else None
+
+
+async def save_idempotent(key, fingerprint, response, ttl):
+    """Сохраняет ответ по ключу и заодно чистит истёкшие ключи."""
+    now = time.time()
+
+    async def op(db):
+        await db.execute("DELETE FROM idempotency_keys WHERE expires_at<=?", (now,))
+        await db.execute(
+            "INSERT OR REPLACE INTO idempotency_keys (key, fingerprint, response, expires_at) VALUES (?,?,?,?)",
+            (key, fingerprint, json.dumps(response, ensure_ascii=False), now + ttl),
+        )
+    await _pool.write(op)
+
+
+idempotency = Idempotency(load_idempotent, save_idempotent, ttl=IDEMPOTENCY_TTL)
 
 
 # --- Хелперы ---
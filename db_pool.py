@@ -0,0 +1,232 @@
+"""
+Inside PC — пул соединений SQLite.
+
+Соединения открываются один раз при старте и живут до остановки:
+один писатель (под замком) и несколько читателей.
+К каждому соединению применяется профиль PRAGMA (WAL и т.д.).
+
+Записи из обработчиков идут через очередь писателя (Pool.write):
+операции, пришедшие в пределах нескольких миллисекунд, выполняются
+в одной транзакции (group commit), каждая — в своём SAVEPOINT.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+log = logging.getLogger("insidepc.db")
+
+_STOP = object()
+
+
+class Pool:
+    """Долгоживущие соединения aiosqlite: 1 писатель + N читателей."""
+
+    def __init__(self, path, readers=4, pragmas=None, checkpoint_interval=0,
+                 group_window_ms=5, group_max=100):
+        self.path = path
+        self.size = max(1, readers)
+        self.pragmas = dict(pragmas or {})
+        self.checkpoint_interval = checkpoint_interval
+        self.group_window = group_window_ms / 1000
+        self.group_max = max(1, group_max)
+        self._checkpointer = None
+        self._write_queue = asyncio.Queue()
+        self._write_task = None
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+        self._readers = asyncio.Queue()
+        self._all = []
+        self._open_lock = asyncio.Lock()
+        self._stats = {"reads": 0, "writes": 0, "read_waits": 0, "write_waits": 0,
+                       "checkpoints": 0, "batches": 0, "batched_ops": 0}
+
+    @property
+    def is_open(self):
+        return self._writer is not None
+
+    async def _connect(self):
+        db = await aiosqlite.connect(self.path)
+        db.row_factory = aiosqlite.Row
+        for name, value in self.pragmas.items():
+            await db.execute(f"PRAGMA {name}={value}")
+        self._all.append(db)
+        return db
+
+    async def _checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                async with self.writer() as db:
+                    await db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+                self._stats["checkpoints"] += 1
+            except Exception as e:
+                log.error(f"checkpoint: {e}")
+
+    async def open(self):
+        """Открывает соединения. Повторный вызов ничего не делает."""
+        async with self._open_lock:
+            if self.is_open:
+                return
+            self._writer = await self._connect()
+            for _ in range(self.size):
+                self._readers.put_nowait(await self._connect())
+            self._write_task = asyncio.create_task(self._write_loop())
+            if self.checkpoint_interval > 0:
+                self._checkpointer = asyncio.create_task(self._checkpoint_loop())
+
+    async def close(self):
+        """Дожидается очереди записи и закрывает все соединения."""
+        async with self._open_lock:
+            if not self.is_open:
+                return
+            if self._checkpointer:
+                self._checkpointer.cancel()
+                self._checkpointer = None
+            if self._write_task:
+                self._write_queue.put_nowait(_STOP)
+                await self._write_task
+                self._write_task = None
+            async with self._write_lock:
+                for db in self._all:
+                    await db.close()
+                self._all.clear()
+                self._writer = None
+                self._readers = asyncio.Queue()
+
+    @asynccontextmanager
+    async def reader(self):
+        """Соединение для чтения из пула."""
+        if not self.is_open:
+            await self.open()
+        if self._readers.empty():
+            self._stats["read_waits"] += 1
+        db = await self._readers.get()
+        self._stats["reads"] += 1
+        try:
+            yield db
+        finally:
+            self._readers.put_nowait(db)
+
+    @asynccontextmanager
+    async def writer(self):
+        """Единственное соединение для записи. Коммит — на стороне вызывающего."""
+        if not self.is_open:
+            await self.open()
+        if self._write_lock.locked():
+            self._stats["write_waits"] += 1
+        async with self._write_lock:
+            self._stats["writes"] += 1
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+    # ---- запросы с моделью строки ----
+
+    async def fetchone(self, sql, params=(), model=None):
+        """Одна строка (model(*row), если модель задана) или None."""
+        async with self.reader() as db:
+            cur = await db.execute(sql, params)
+            row = await cur.fetchone()
+        if row is None:
+            return None
+        return model(*row) if model else row
+
+    async def fetchall(self, sql, params=(), model=None):
+        async with self.reader() as db:
+            cur = await db.execute(sql, params)
+            rows = await cur.fetchall()
+        return [model(*r) for r in rows] if model else rows
+
+    async def write_returning(self, sql, params=(), model=None):
+        """INSERT/UPDATE ... RETURNING через очередь писателя; первая строка или None."""
+        async def op(db):
+            cur = await db.execute(sql, params)
+            rows = await cur.fetchall()
+            return rows[0] if rows else None
+        row = await self.write(op)
+        if row is None:
+            return None
+        return model(*row) if model else row
+
+    # ---- очередь писателя ----
+
+    async def write(self, op):
+        """
+        Выполняет op(db) в писателе и возвращает её результат.
+        Возвращается только после коммита пачки, поэтому следующее
+        чтение из пула уже видит запись. op не должна сама делать commit.
+        """
+        if not self.is_open:
+            await self.open()
+        fut = asyncio.get_running_loop().create_future()
+        self._write_queue.put_nowait((op, fut))
+        return await fut
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._write_queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stop = False
+            deadline = loop.time() + self.group_window
+            while len(batch) < self.group_max:
+                timeout = deadline - loop.time()
+                try:
+                    item = self._write_queue.get_nowait() if timeout <= 0 else \
+                        await asyncio.wait_for(self._write_queue.get(), timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            await self._commit_batch(batch)
+            if stop:
+                return
+
+    async def _commit_batch(self, batch):
+        results = []
+        try:
+            async with self.writer() as db:
+                await db.execute("BEGIN IMMEDIATE")
+                for op, fut in batch:
+                    await db.execute("SAVEPOINT op")
+                    try:
+                        res = await op(db)
+                    except Exception as e:
+                        await db.execute("ROLLBACK TO op")
+                        results.append((fut, None, e))
+                    else:
+                        results.append((fut, res, None))
+                    await db.execute("RELEASE op")
+                await db.commit()
+        except Exception as e:
+            log.error(f"group commit: {e}")
+            results = [(fut, None, e) for _, fut in batch]
+        self._stats["batches"] += 1
+        self._stats["batched_ops"] += len(batch)
+        for fut, res, err in results:
+            if fut.done():
+                continue
+            if err is not None:
+                fut.set_exception(err)
+            else:
+                fut.set_result(res)
+
+    def stats(self):
+        """Счётчики пула."""
+        return {
+            "open": self.is_open,
+            "journal_mode": self.pragmas.get("journal_mode", "default"),
+            "readers": self.size,
+            "readers_idle": self._readers.qsize(),
+            "writer_busy": self._write_lock.locked(),
+            "write_queue": self._write_queue.qsize(),
+            **self._stats,
+        }
@@ -0,0 +1,177 @@
+"""
+Inside PC — события заказов для подписчиков (SSE / WebSocket).
+
+Внутрипроцессный pub/sub: database публикует событие после коммита,
+каждый подключённый клиент получает его через свою очередь. Темы:
+order:<id>, user:<id> и orders (все заказы — для админки).
+
+Последние события хранятся в кольцевом буфере: клиент, переподключившийся
+с Last-Event-ID, получает пропущенное. Очередь подписчика ограничена;
+если клиент не успевает читать, подписка закрывается, и клиент
+переподключается (с Last-Event-ID) вместо того, чтобы копить память.
+"""
+import asyncio
+import itertools
+import json
+from collections import deque
+
+from fastapi import WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+CLOSED = object()
+
+
+class Subscription:
+    __slots__ = ("topics", "queue")
+
+    def __init__(self, topics, size):
+        self.topics = frozenset(topics)
+        self.queue = asyncio.Queue(size)
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def get(self, timeout=None):
+        """Следующее (seq, событие); None — таймаут; CLOSED — подписка закрыта."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Broker:
+    def __init__(self, queue_size=100, history=500):
+        self.queue_size = queue_size
+        self._subs = {}                       # тема -> set(Subscription)
+        self._history = deque(maxlen=history)  # (seq, темы, событие)
+        self._seq = itertools.count(1)
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, topics, event):
+        """Рассылает событие подписчикам тем. Вызывать после коммита."""
+        seq = next(self._seq)
+        self._history.append((seq, topics, event))
+        self.published += 1
+        seen = set()
+        for topic in topics:
+            for sub in tuple(self._subs.get(topic, ())):
+                if sub in seen:
+                    continue
+                seen.add(sub)
+                if not sub._put((seq, event)):
+                    self._close(sub)
+
+    def _close(self, sub):
+        self._unsubscribe(sub)
+        self.dropped += 1
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        sub._put(CLOSED)
+
+    def subscribe(self, topics, last_id=None):
+        """Новая подписка; при last_id в очередь сразу кладутся пропущенные события."""
+        sub = Subscription(topics, self.queue_size)
+        if last_id is not None:
+            for seq, event_topics, event in self._history:
+                if seq > last_id and sub.topics.intersection(event_topics):
+                    if not sub._put((seq, event)):
+                        break
+        for topic in sub.topics:
+            self._subs.setdefault(topic, set()).add(sub)
+        return sub
+
+    def _unsubscribe(self, sub):
+        for topic in sub.topics:
+            subs = self._subs.get(topic)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[topic]
+
+    def unsubscribe(self, sub):
+        self._unsubscribe(sub)
+
+    def stats(self):
+        return {"topics": len(self._subs), "subscribers": len(set().union(*self._subs.values())),
+                "published": self.published, "dropped": self.dropped}
+
+
+broker = Broker()
+
+
+def order_topics(order):
+    return (f"order:{order.id}", f"user:{order.user_id}", "orders")
+
+
+def topics_from_query(order_ids=(), user_ids=(), all_orders=False):
+    """Темы подписки из параметров запроса."""
+    topics = [f"order:{i}" for i in order_ids] + [f"user:{i}" for i in user_ids]
+    if all_orders:
+        topics.append("orders")
+    return topics
+
+
+async def sse_stream(topics, last_id=None, heartbeat=15):
+    """
+    Поток text/event-stream: события как `id/event/data`, комментарий-пинг
+    раз в heartbeat секунд, чтобы прокси не рвали простаивающее соединение.
+    """
+    sub = broker.subscribe(topics, last_id)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            item = await sub.get(heartbeat)
+            if item is CLOSED:
+                return
+            if item is None:
+                yield ": ping\n\n"
+                continue
+            seq, event = item
+            yield f"id: {seq}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    finally:
+        broker.unsubscribe(sub)
+
+
+async def ws_pump(ws, topics, last_id=None, heartbeat=30):
+    """Отправляет события в уже принятый WebSocket до отключения клиента."""
+    sub = broker.subscribe(topics, last_id)
+    try:
+        while True:
+            item = await sub.get(heartbeat)
+            if item is CLOSED:
+                return
+            if item is None:
+                await ws.send_json({"type": "ping"})
+                continue
+            seq, event = item
+            await ws.send_json({**event, "id": seq})
+    finally:
+        broker.unsubscribe(sub)
+
+
+def _last_id(raw):
+    return int(raw) if raw and raw.isdigit() else None
+
+
+def sse_response(topics, last_event_id=None):
+    """StreamingResponse с потоком событий; last_event_id — заголовок Last-Event-ID."""
+    return StreamingResponse(
+        sse_stream(topics, _last_id(last_event_id)), media_type="text/event-stream",
+        # X-Accel-Buffering: nginx не копит поток в буфере
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def ws_serve(ws, topics, last_id=None):
+    """Принимает WebSocket и шлёт события, пока клиент не отключится."""
+    await ws.accept()
+    try:
+        await ws_pump(ws, topics, _last_id(last_id))
+    except (WebSocketDisconnect, ConnectionError, RuntimeError):
+        # Отключение клиента посреди send_json — обычное завершение
+        pass
@@ -0,0 +1,31 @@
+"""
+Inside PC — быстрый JSON для ответов API.
+
+orjson — необязательная зависимость: без неё используется stdlib json
+с теми же компактными разделителями. JSONResponse ставится как
+default_response_class приложения; маршруты с горячими списками
+возвращают его сами — тогда FastAPI не прогоняет ответ через
+jsonable_encoder и response_model (модель остаётся только для схемы).
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from fastapi.responses import Response
+
+
+def dumps(data) -> bytes:
+    """dict/list/str/числа -> UTF-8 JSON без пробелов."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class JSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,58 @@
+"""
+Inside PC — file_id -> file_path через Bot API getFile.
+
+Результаты кэшируются чуть меньше часа (столько Telegram гарантирует
+жизнь ссылки), одновременные запросы одного file_id делят один вызов,
+а число параллельных getFile ограничено семафором.
+"""
+import asyncio
+import logging
+
+from cache import TTLCache
+
+log = logging.getLogger("insidepc.files")
+
+
+class FileResolver:
+    def __init__(self, bot, base_url, ttl=3300, maxsize=10000, concurrency=8):
+        self.bot = bot
+        self.base_url = base_url.rstrip("/")
+        self._paths = TTLCache(maxsize, ttl)
+        self._inflight = {}
+        self._sem = asyncio.Semaphore(concurrency)
+        self.calls = 0
+
+    def url(self, file_path):
+        """Прямая ссылка на файл (содержит токен — не отдавать клиентам)."""
+        return f"{self.base_url}/bot{self.bot.token}/{file_path}"
+
+    async def _fetch(self, file_id):
+        async with self._sem:
+            self.calls += 1
+            try:
+                file = await self.bot.get_file(file_id)
+            except Exception as e:
+                log.warning(f"getFile {file_id}: {e}")
+                return None
+        self._paths.set(file_id, file.file_path)
+        return file.file_path
+
+    async def path(self, file_id):
+        """file_path или None, если Telegram файл не отдал."""
+        path = self._paths.get(file_id)
+        if path is not None:
+            return path
+        task = self._inflight.get(file_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(file_id))
+            self._inflight[file_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(file_id, None))
+        return await asyncio.shield(task)
+
+    async def paths(self, file_ids):
+        """{file_id: file_path | None} для пачки file_id."""
+        file_ids = list(dict.fromkeys(file_ids))
+        return dict(zip(file_ids, await asyncio.gather(*(self.path(f) for f in file_ids))))
+
+    def stats(self):
+        return {"cache": self._paths.stats(), "inflight": len(self._inflight), "calls": self.calls}
@@ -0,0 +1,59 @@
+"""
+Inside PC — идемпотентность POST-запросов по заголовку Idempotency-Key.
+
+Ответ на первый запрос сохраняется в БД на TTL; повтор с тем же ключом
+получает сохранённый ответ (один поиск по первичному ключу). Пока первый
+запрос ещё выполняется, повторы ждут его результата, а не запускают
+обработку заново. Тот же ключ с другим телом — ошибка клиента.
+"""
+import asyncio
+import hashlib
+import json
+
+
+class IdempotencyMismatch(Exception):
+    """Ключ уже использован для запроса с другим телом."""
+
+
+def fingerprint(body):
+    return hashlib.sha256(json.dumps(body, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+class Idempotency:
+    def __init__(self, load, save, ttl=24 * 3600):
+        self._load = load      # async (key) -> (fingerprint, response) | None
+        self._save = save      # async (key, fingerprint, response, ttl)
+        self.ttl = ttl
+        self._inflight = {}    # key -> (fingerprint, task)
+        self.replays = 0
+
+    async def _execute(self, key, fp, handler):
+        response = await handler()
+        await self._save(key, fp, response, self.ttl)
+        return response
+
+    async def run(self, key, body, handler):
+        """
+        Выполняет handler() один раз на ключ. Возвращает (ответ, повтор ли это).
+        Исключение обработчика не сохраняется — клиент может повторить с тем же ключом.
+        """
+        fp = fingerprint(body)
+        running = self._inflight.get(key)
+        if running is None:
+            stored = await self._load(key)
+            if stored is not None:
+                if stored[0] != fp:
+                    raise IdempotencyMismatch(key)
+                self.replays += 1
+                return stored[1], True
+            # Пока ходили в БД, первый запрос мог стартовать
+            running = self._inflight.get(key)
+        if running is not None:
+            if running[0] != fp:
+                raise IdempotencyMismatch(key)
+            self.replays += 1
+            return await asyncio.shield(running[1]), True
+        task = asyncio.ensure_future(self._execute(key, fp, handler))
+        self._inflight[key] = (fp, task)
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task), False
@@ -0,0 +1,211 @@
+"""
+Inside PC — локальный кэш медиа из Telegram.
+
+Файл скачивается с файлового сервера Bot API один раз и кладётся
+в objects/<sha256 содержимого><расширение>; by-id/<хэш file_id> —
+симлинк на объект, поэтому одинаковые файлы хранятся один раз; при
+удалении объекта удаляются и его симлинки.
+derived/<объект>/ — производные версии (см. thumbs.py): входят в размер
+объекта и удаляются вместе с ним.
+Общий размер ограничен, при переполнении удаляются давно не
+запрашивавшиеся объекты (LRU по mtime, переживает перезапуск).
+"""
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import aiohttp
+
+log = logging.getLogger("insidepc.media")
+
+_CHUNK = 64 * 1024
+_WRITE_BUFFER = 1024 * 1024  # запись на диск — в потоке, пачками
+
+
+def _dir_size(path):
+    total = 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False):
+                    total += entry.stat().st_size
+    except OSError:
+        pass
+    return total
+
+
+class MediaCache:
+    def __init__(self, root, resolver, max_bytes=512 * 1024 * 1024):
+        self.root = root
+        self.resolver = resolver
+        self.max_bytes = max_bytes
+        self._objects = os.path.join(root, "objects")
+        self._by_id = os.path.join(root, "by-id")
+        self._tmp = os.path.join(root, "tmp")
+        self._derived = os.path.join(root, "derived")
+        self._lru = OrderedDict()  # имя объекта -> размер вместе с производными
+        self._links = {}           # имя объекта -> set(симлинков by-id)
+        self._size = 0
+        self._inflight = {}
+        self._session = None
+        self.downloads = 0
+        self.hits = 0
+        for d in (self._objects, self._by_id, self._tmp, self._derived):
+            os.makedirs(d, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        entries = []
+        for name in os.listdir(self._objects):
+            st = os.stat(os.path.join(self._objects, name))
+            entries.append((st.st_mtime, name, st.st_size + _dir_size(os.path.join(self._derived, name))))
+        for _, name, size in sorted(entries):
+            self._lru[name] = size
+            self._size += size
+        for name in os.listdir(self._derived):
+            if name not in self._lru:
+                shutil.rmtree(os.path.join(self._derived, name), ignore_errors=True)
+        for link in os.listdir(self._by_id):
+            path = os.path.join(self._by_id, link)
+            try:
+                name = os.path.basename(os.readlink(path))
+            except OSError:
+                name = None
+            if name in self._lru:
+                self._links.setdefault(name, set()).add(path)
+            else:
+                # Висячий симлинк (или недописанный .pid) от прошлого запуска
+                self._unlink(path)
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _link(self, file_id):
+        return os.path.join(self._by_id, hashlib.sha256(file_id.encode()).hexdigest())
+
+    def _touch(self, name):
+        self._lru.move_to_end(name)
+        try:
+            os.utime(os.path.join(self._objects, name))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._lru) > 1:
+            name, size = self._lru.popitem(last=False)
+            self._size -= size
+            self._unlink(os.path.join(self._objects, name))
+            for link in self._links.pop(name, ()):
+                self._unlink(link)
+            shutil.rmtree(os.path.join(self._derived, name), ignore_errors=True)
+
+    def derived_dir(self, path):
+        """Каталог производных версий объекта по пути к нему."""
+        return os.path.join(self._derived, os.path.basename(path))
+
+    def add_derived(self, path):
+        """Пересчитывает размер объекта с его производными версиями (после thumbs)."""
+        name = os.path.basename(path)
+        if name not in self._lru:
+            return
+        try:
+            size = os.path.getsize(path) + _dir_size(self.derived_dir(path))
+        except OSError:
+            return
+        self._size += size - self._lru[name]
+        self._lru[name] = size
+        # Только что отрисованный объект вытесняется последним
+        self._touch(name)
+        self._evict()
+
+    def _lookup(self, file_id):
+        """Путь к объекту в кэше или None (битый симлинк — тоже промах)."""
+        link = self._link(file_id)
+        try:
+            name = os.path.basename(os.readlink(link))
+        except OSError:
+            return None
+        if name not in self._lru:
+            self._unlink(link)
+            return None
+        self._touch(name)
+        return os.path.join(self._objects, name)
+
+    async def _download(self, file_id):
+        path = await self.resolver.path(file_id)
+        if not path:
+            return None
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60))
+        ext = os.path.splitext(path)[1].lower()
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self._tmp)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                buf = bytearray()
+                async with self._session.get(self.resolver.url(path)) as resp:
+                    resp.raise_for_status()
+                    async for chunk in resp.content.iter_chunked(_CHUNK):
+                        digest.update(chunk)
+                        buf += chunk
+                        size += len(chunk)
+                        # Большой файл не блокирует цикл событий записью на диск
+                        if len(buf) >= _WRITE_BUFFER:
+                            await asyncio.to_thread(f.write, buf)
+                            buf.clear()
+                if buf:
+                    await asyncio.to_thread(f.write, buf)
+            name = digest.hexdigest() + ext
+            await asyncio.to_thread(os.replace, tmp, os.path.join(self._objects, name))
+        except Exception as e:
+            log.warning(f"download {file_id}: {e}")
+            self._unlink(tmp)
+            return None
+        if name not in self._lru:
+            self._size += size
+            self._lru[name] = size
+        self._touch(name)
+        link = self._link(file_id)
+        tmp_link = f"{link}.{os.getpid()}"
+        os.symlink(os.path.join("..", "objects", name), tmp_link)
+        os.replace(tmp_link, link)
+        self._links.setdefault(name, set()).add(link)
+        self.downloads += 1
+        self._evict()
+        return os.path.join(self._objects, name)
+
+    async def get(self, file_id):
+        """Локальный путь файла (скачивает при промахе) или None."""
+        path = self._lookup(file_id)
+        if path:
+            self.hits += 1
+            return path
+        task = self._inflight.get(file_id)
+        if task is None:
+            task = asyncio.ensure_future(self._download(file_id))
+            self._inflight[file_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(file_id, None))
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def media_type(path):
+        return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def stats(self):
+        return {"objects": len(self._lru), "bytes": self._size, "max_bytes": self.max_bytes,
+                "downloads": self.downloads, "hits": self.hits, "inflight": len(self._inflight)}
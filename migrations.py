@@ -0,0 +1,203 @@
+"""
+Inside PC — версионные миграции схемы SQLite.
+
+Текущая версия хранится в таблице schema_version. Новые миграции
+применяются по порядку в одной транзакции: либо все, либо ни одной.
+Шаг миграции — SQL-строка или корутина, принимающая соединение.
+"""
+import logging
+
+log = logging.getLogger("insidepc.db")
+
+
+async def _column_exists(db, table, column):
+    cur = await db.execute(f"PRAGMA table_info({table})")
+    return any(r[1] == column for r in await cur.fetchall())
+
+
+async def _add_active_order(db):
+    # Старые базы создавались без active_order, новые — уже с ним
+    if not await _column_exists(db, "users", "active_order"):
+        await db.execute("ALTER TABLE users ADD COLUMN active_order INTEGER DEFAULT 0")
+
+
+MIGRATIONS = [
+    (1, "базовая схема", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            full_name TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            service_type TEXT NOT NULL,
+            has_parts INTEGER DEFAULT 0,
+            parts_data TEXT,
+            description TEXT,
+            status TEXT DEFAULT 'pending_payment',
+            payment_photo TEXT,
+            topic_id INTEGER,
+            price_byn REAL,
+            price_rub REAL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS topic_links (
+            topic_id INTEGER PRIMARY KEY,
+            order_id INTEGER,
+            user_id INTEGER
+        )
+        """,
+    ]),
+    (2, "users.active_order", [_add_active_order]),
+    (3, "портфолио", [
+        """
+        CREATE TABLE IF NOT EXISTS portfolio (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT DEFAULT '',
+            description TEXT DEFAULT '',
+            specs TEXT DEFAULT '',
+            price_byn REAL DEFAULT 0,
+            price_rub REAL DEFAULT 0,
+            photo_ids TEXT DEFAULT '[]',
+            category TEXT DEFAULT '',
+            is_visible INTEGER DEFAULT 1,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (4, "индексы для заказов и топиков", [
+        # get_user_orders: WHERE user_id=? ORDER BY created_at DESC
+        "CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders(user_id, created_at DESC)",
+        # get_latest_pending_order: WHERE user_id=? AND status=? ORDER BY created_at DESC
+        "CREATE INDEX IF NOT EXISTS idx_orders_user_status_created ON orders(user_id, status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)",
+        # get_topic_by_order
+        "CREATE INDEX IF NOT EXISTS idx_topic_links_order ON topic_links(order_id)",
+    ]),
+    (5, "индекс для постраничной истории заказов", [
+        # get_user_orders: WHERE user_id=? AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC
+        "CREATE INDEX IF NOT EXISTS idx_orders_user_created_id ON orders(user_id, created_at, id)",
+        "DROP INDEX IF EXISTS idx_orders_user_created",
+    ]),
+    (6, "фото портфолио в отдельной таблице", [
+        """
+        CREATE TABLE IF NOT EXISTS portfolio_photos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            file_unique_id TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_portfolio_photos_item ON portfolio_photos(item_id, position)",
+        # Переносим JSON-список photo_ids: позиция = индекс в массиве
+        """
+        INSERT INTO portfolio_photos (item_id, position, file_id)
+        SELECT p.id, j.key, j.value FROM portfolio p, json_each(p.photo_ids) j
+        WHERE json_valid(p.photo_ids) AND j.type = 'text'
+        """,
+        "ALTER TABLE portfolio DROP COLUMN photo_ids",
+        # Работа вместе с photo_ids (JSON-массив по position) — одним запросом
+        """
+        CREATE VIEW IF NOT EXISTS portfolio_items AS
+        SELECT p.*, (
+            SELECT json_group_array(file_id) FROM (
+                SELECT file_id FROM portfolio_photos WHERE item_id = p.id ORDER BY position
+            )
+        ) AS photo_ids
+        FROM portfolio p
+        """,
+    ]),
+    (7, "portfolio.version для оптимистической блокировки", [
+        "ALTER TABLE portfolio ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+    ]),
+    (8, "outbox уведомлений", [
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            dedup_key TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_at REAL NOT NULL DEFAULT 0,
+            locked_until REAL,
+            last_error TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Одно недоставленное задание на ключ; окончательно упавшие ключ не держат
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_outbox_dedup ON outbox(dedup_key) WHERE status != 'failed'",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_at)",
+    ]),
+    (9, "ключи идемпотентности", [
+        """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            response TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_idempotency_expires ON idempotency_keys(expires_at)",
+    ]),
+    (10, "индекс ленты портфолио", [
+        # get_portfolio_all: WHERE is_visible=1 ORDER BY created_at DESC — без сортировки
+        "CREATE INDEX IF NOT EXISTS idx_portfolio_visible_created ON portfolio(is_visible, created_at)",
+    ]),
+]
+
+
+async def _current_version(db):
+    cur = await db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return (await cur.fetchone())[0]
+
+
+async def schema_version(db):
+    """Текущая версия схемы (0 — чистая база)."""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return await _current_version(db)
+
+
+async def migrate(db, migrations=MIGRATIONS):
+    """Применяет недостающие миграции одной транзакцией. Возвращает версию схемы."""
+    current = await schema_version(db)
+    await db.commit()
+    if not any(m[0] > current for m in migrations):
+        return current
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        # Версию перечитываем под блокировкой: другой процесс мог успеть
+        # применить те же миграции, пока мы ждали BEGIN IMMEDIATE
+        current = await _current_version(db)
+        pending = [m for m in migrations if m[0] > current]
+        if not pending:
+            await db.commit()
+            return current
+        for version, description, steps in pending:
+            for step in steps:
+                if isinstance(step, str):
+                    await db.execute(step)
+                else:
+                    await step(db)
+            await db.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)", (version, description),
+            )
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    log.info(f"Схема БД: {current} -> {pending[-1][0]}")
+    return pending[-1][0]
@@ -0,0 +1,138 @@
+"""
+Inside PC — модели строк БД.
+
+Слотовые dataclass'ы собираются прямо из строки курсора: Order(*row),
+где row выбран по Order.COLUMNS. JSON-колонки (parts_data, photo_ids)
+разбираются один раз при первом обращении к .parts / .photos.
+Экземпляры лежат в кэшах и общие для всех обработчиков — не изменять.
+"""
+import json
+from dataclasses import dataclass, field, fields
+from typing import ClassVar
+
+_UNSET = object()
+
+
+def _loads(raw, default):
+    if not raw:
+        return default
+    try:
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        return default
+
+
+def columns(model, alias):
+    """Список колонок модели с префиксом таблицы — для JOIN."""
+    return ", ".join(f"{alias}.{c.strip()}" for c in model.COLUMNS.split(","))
+
+
+def width(model):
+    return model.COLUMNS.count(",") + 1
+
+
+class _Row:
+    """Доступ как к dict (row["status"], row.get(...)) для старого кода."""
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self):
+        return {f.name: getattr(self, f.name) for f in fields(self) if not f.name.startswith("_")}
+
+
+@dataclass(slots=True)
+class User(_Row):
+    COLUMNS: ClassVar[str] = "user_id, username, full_name, active_order"
+
+    user_id: int
+    username: str | None = None
+    full_name: str | None = None
+    active_order: int | None = 0
+
+
+@dataclass(slots=True)
+class Order(_Row):
+    COLUMNS: ClassVar[str] = (
+        "id, user_id, service_type, has_parts, parts_data, description, status, "
+        "payment_photo, topic_id, price_byn, price_rub, created_at"
+    )
+
+    id: int
+    user_id: int
+    service_type: str
+    has_parts: int = 0
+    parts_data: str | None = None
+    description: str | None = None
+    status: str = "pending_payment"
+    payment_photo: str | None = None
+    topic_id: int | None = None
+    price_byn: float | None = None
+    price_rub: float | None = None
+    created_at: str = ""
+    _parts: object = field(default=_UNSET, repr=False, compare=False)
+
+    @property
+    def parts(self):
+        """parts_data как dict (None, если нет или битый JSON)."""
+        if self._parts is _UNSET:
+            self._parts = _loads(self.parts_data, None)
+        return self._parts
+
+
+@dataclass(slots=True)
+class OrderSummary(_Row):
+    """Строка списка заказов — только то, что показывают списки."""
+    COLUMNS: ClassVar[str] = "id, service_type, status, price_byn, price_rub, created_at"
+
+    id: int
+    service_type: str
+    status: str = "pending_payment"
+    price_byn: float | None = None
+    price_rub: float | None = None
+    created_at: str = ""
+
+
+@dataclass(slots=True)
+class PortfolioItem(_Row):
+    """Строка view portfolio_items: photo_ids собран из portfolio_photos."""
+    COLUMNS: ClassVar[str] = (
+        "id, title, description, specs, price_byn, price_rub, photo_ids, "
+        "category, is_visible, created_at, version"
+    )
+
+    id: int
+    title: str = ""
+    description: str = ""
+    specs: str = ""
+    price_byn: float = 0
+    price_rub: float = 0
+    photo_ids: str = "[]"
+    category: str = ""
+    is_visible: int = 1
+    created_at: str = ""
+    version: int = 0
+    _photos: object = field(default=_UNSET, repr=False, compare=False)
+
+    @property
+    def photos(self):
+        """photo_ids как список file_id."""
+        if self._photos is _UNSET:
+            self._photos = _loads(self.photo_ids, [])
+        return self._photos
+
+
+@dataclass(slots=True)
+class TopicLink(_Row):
+    COLUMNS: ClassVar[str] = "topic_id, order_id, user_id"
+
+    topic_id: int
+    order_id: int
+    user_id: int
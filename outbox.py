@@ -0,0 +1,135 @@
+"""
+Inside PC — outbox уведомлений.
+
+Задания (kind + JSON payload) пишутся в таблицу outbox в той же
+транзакции, что и изменение заказа, а доставляет их фоновый
+OutboxWorker: с повторами и экспоненциальной паузой.
+
+Взятое задание помечается 'sending' с арендой (locked_until); если
+процесс упал посреди доставки, после истечения аренды задание снова
+берётся в работу. Доставка — "хотя бы один раз", поэтому обработчики
+должны спокойно переносить повтор. dedup_key не даёт поставить
+одинаковое задание дважды, пока первое не доставлено.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+
+log = logging.getLogger("insidepc.outbox")
+
+_wakeup = asyncio.Event()
+
+
+async def enqueue(db, kind, payload, dedup_key=None):
+    """Ставит задание. Вызывать внутри операции записи (Pool.write)."""
+    await db.execute(
+        "INSERT OR IGNORE INTO outbox (kind, payload, dedup_key) VALUES (?, ?, ?)",
+        (kind, json.dumps(payload, ensure_ascii=False), dedup_key),
+    )
+
+
+def wake():
+    """Будит воркер после коммита — не ждать очередного опроса."""
+    _wakeup.set()
+
+
+class OutboxWorker:
+    def __init__(self, pool, handlers, batch=20, lease=60, max_attempts=8,
+                 base_delay=2, max_delay=300, poll=5):
+        self.pool = pool
+        self.handlers = handlers
+        self.batch = batch
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll = poll
+        self._task = None
+        self._stats = {"delivered": 0, "retried": 0, "failed": 0}
+
+    def start(self):
+        """Запускает цикл доставки. Повторный вызов ничего не делает."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _claim(self):
+        now = time.time()
+
+        async def op(db):
+            cur = await db.execute(
+                "UPDATE outbox SET status='sending', locked_until=? WHERE id IN ("
+                " SELECT id FROM outbox WHERE (status='pending' AND next_at<=?)"
+                " OR (status='sending' AND locked_until<?) ORDER BY id LIMIT ?"
+                ") RETURNING id, kind, payload, attempts",
+                (now + self.lease, now, now, self.batch),
+            )
+            return await cur.fetchall()
+        return sorted(await self.pool.write(op), key=lambda r: r[0])
+
+    async def _done(self, job_id):
+        async def op(db):
+            await db.execute("DELETE FROM outbox WHERE id=?", (job_id,))
+        await self.pool.write(op)
+
+    async def _retry(self, job_id, attempts, error):
+        failed = attempts >= self.max_attempts
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+
+        async def op(db):
+            await db.execute(
+                "UPDATE outbox SET status=?, attempts=?, next_at=?, locked_until=NULL, last_error=? WHERE id=?",
+                ("failed" if failed else "pending", attempts, time.time() + delay, error[:500], job_id),
+            )
+        await self.pool.write(op)
+        self._stats["failed" if failed else "retried"] += 1
+        return failed
+
+    async def _deliver(self, job_id, kind, payload, attempts):
+        handler = self.handlers.get(kind)
+        try:
+            if handler is None:
+                raise LookupError(f"нет обработчика {kind}")
+            await handler(json.loads(payload))
+        except Exception as e:
+            if await self._retry(job_id, attempts + 1, f"{type(e).__name__}: {e}"):
+                log.error(f"outbox #{job_id} {kind}: не доставлено после {attempts + 1} попыток: {e}")
+            else:
+                log.warning(f"outbox #{job_id} {kind}: {e}")
+            return
+        await self._done(job_id)
+        self._stats["delivered"] += 1
+
+    async def _run(self):
+        while True:
+            _wakeup.clear()
+            try:
+                jobs = await self._claim()
+                for job in jobs:
+                    await self._deliver(*job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"outbox: {e}")
+                jobs = []
+            if len(jobs) < self.batch:
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), self.poll)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def stats(self):
+        async with self.pool.reader() as db:
+            cur = await db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status")
+            queued = {status: n for status, n in await cur.fetchall()}
+        return {**self._stats, "queued": queued}
@@ -0,0 +1,211 @@
+"""
+Inside PC — ограничение частоты запросов (token bucket).
+
+Правило — (rate токенов в секунду, ёмкость burst); у каждого ключа
+(пользователь или IP) своё ведро. Ведро хранит только два числа; полное
+ведро ничем не отличается от отсутствующего, поэтому простаивающие
+ключи просто удаляются при периодической чистке.
+
+RateLimitMiddleware — ASGI-middleware для FastAPI: правило выбирается
+по "МЕТОД /префикс" пути, пользователь — из /api/orders/{user_id},
+?user_id= или поля user_id JSON-тела, иначе ключ — IP клиента. Если
+передан identify (проверка сессий), заявленным в запросе id не верим:
+ключ — проверенный пользователь или IP.
+ThrottleMiddleware — то же для апдейтов aiogram в личных чатах
+(ключ — from_user.id); группа менеджеров не ограничивается.
+"""
+import asyncio
+import json
+import math
+import re
+import time
+from collections import deque
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+
+from fastjson import JSONResponse
+
+_USER_PATH = re.compile(r"^/api/orders/(\d+)")
+_PEEK_LIMIT = 64 * 1024
+
+
+class _Bucket:
+    __slots__ = ("tokens", "stamp")
+
+    def __init__(self, tokens, stamp):
+        self.tokens = tokens
+        self.stamp = stamp
+
+
+class Limiter:
+    def __init__(self, rate, burst, max_keys=100_000, sweep_every=60):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.sweep_every = sweep_every
+        self._buckets = {}
+        self._swept = time.monotonic()
+        self.rejected = 0
+
+    def _take(self, key, cost):
+        now = time.monotonic()
+        if now - self._swept > self.sweep_every or len(self._buckets) > self.max_keys:
+            self._sweep(now)
+        b = self._buckets.get(key)
+        if b is None:
+            b = self._buckets[key] = _Bucket(self.burst, now)
+        else:
+            b.tokens = min(self.burst, b.tokens + (now - b.stamp) * self.rate)
+            b.stamp = now
+        if b.tokens >= cost:
+            b.tokens -= cost
+            return 0
+        return (cost - b.tokens) / self.rate
+
+    def hit(self, key, cost=1):
+        """Списывает cost токенов. 0 — можно; иначе секунд до следующей попытки."""
+        wait = self._take(key, cost)
+        if wait:
+            self.rejected += 1
+        return wait
+
+    async def acquire(self, key="*", cost=1):
+        """Ждёт, пока в ведре появятся токены, — для исходящих вызовов (Bot API)."""
+        while wait := self._take(key, cost):
+            await asyncio.sleep(wait)
+
+    def _sweep(self, now):
+        """Удаляет ведра, которые уже наполнились бы до краёв."""
+        self._swept = now
+        full_after = self.burst / self.rate
+        self._buckets = {k: b for k, b in self._buckets.items() if now - b.stamp < full_after}
+        # Всё ещё много активных ключей — отбрасываем самые старые с запасом,
+        # чтобы не чистить заново на каждом запросе
+        overflow = len(self._buckets) - self.max_keys * 9 // 10
+        if overflow > 0:
+            for k in list(self._buckets)[:overflow]:
+                del self._buckets[k]
+
+    def stats(self):
+        return {"keys": len(self._buckets), "rejected": self.rejected}
+
+
+class RateLimits:
+    """Правила из config.RATE_LIMITS: {"МЕТОД /префикс" | "bot:<апдейт>": (rate, burst)}."""
+
+    def __init__(self, rules, max_keys=100_000):
+        self._limiters = {name: Limiter(rate, burst, max_keys) for name, (rate, burst) in rules.items()}
+        self._http = []
+        for name, limiter in self._limiters.items():
+            method, sep, prefix = name.partition(" ")
+            if sep and prefix.startswith("/"):
+                self._http.append((method, prefix, limiter))
+
+    def __getitem__(self, name):
+        return self._limiters[name]
+
+    def get(self, name):
+        return self._limiters.get(name)
+
+    def match(self, method, path):
+        """Первое подходящее HTTP-правило (порядок — как в конфиге) или None."""
+        for m, prefix, limiter in self._http:
+            if (m == "*" or m == method) and path.startswith(prefix):
+                return limiter
+        return None
+
+    def stats(self):
+        return {name: limiter.stats() for name, limiter in self._limiters.items()}
+
+
+async def _peek_json(receive, limit=_PEEK_LIMIT):
+    """
+    Читает небольшое тело запроса и возвращает (JSON | None, receive), где
+    новый receive сначала отдаёт прочитанное — приложение получит тело целиком.
+    """
+    messages, size = [], 0
+    while True:
+        msg = await receive()
+        messages.append(msg)
+        if msg["type"] != "http.request":
+            break
+        size += len(msg.get("body", b""))
+        if not msg.get("more_body") or size > limit:
+            break
+    data = None
+    last = messages[-1]
+    if last["type"] == "http.request" and not last.get("more_body"):
+        try:
+            data = json.loads(b"".join(m.get("body", b"") for m in messages))
+        except ValueError:
+            pass
+    pending = deque(messages)
+
+    async def replay():
+        return pending.popleft() if pending else await receive()
+    return data, replay
+
+
+def _ip_key(scope):
+    client = scope.get("client")
+    return f"ip{client[0] if client else '?'}"
+
+
+async def _client_key(scope, receive, identify=None):
+    if identify is not None:
+        uid = identify(scope)
+        return (f"u{uid}" if uid is not None else _ip_key(scope)), receive
+    m = _USER_PATH.match(scope["path"])
+    if m:
+        return f"u{m.group(1)}", receive
+    for part in scope.get("query_string", b"").decode("latin-1").split("&"):
+        name, _, value = part.partition("=")
+        if name == "user_id" and value.isdigit():
+            return f"u{value}", receive
+    if scope["method"] == "POST":
+        headers = dict(scope.get("headers", ()))
+        if headers.get(b"content-type", b"").startswith(b"application/json"):
+            data, receive = await _peek_json(receive)
+            if isinstance(data, dict) and isinstance(data.get("user_id"), int):
+                return f"u{data['user_id']}", receive
+    return _ip_key(scope), receive
+
+
+class RateLimitMiddleware:
+    """ASGI-middleware: 429 с Retry-After, если ведро ключа пусто."""
+
+    def __init__(self, app, limits, identify=None):
+        self.app = app
+        self.limits = limits
+        self.identify = identify
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limiter = self.limits.match(scope["method"], scope["path"])
+        if limiter is None:
+            return await self.app(scope, receive, send)
+        key, receive = await _client_key(scope, receive, self.identify)
+        wait = limiter.hit(key)
+        if wait:
+            resp = JSONResponse({"detail": "Слишком много запросов, попробуйте позже"}, status_code=429,
+                                headers={"Retry-After": str(math.ceil(wait))})
+            return await resp(scope, receive, send)
+        await self.app(scope, receive, send)
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    """aiogram-middleware: лишние апдейты пользователя отбрасываются."""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+
+    async def __call__(self, handler, event, data):
+        user, chat = data.get("event_from_user"), data.get("event_chat")
+        if user is None or (chat is not None and chat.type != "private") or not self.limiter.hit(user.id):
+            return await handler(event, data)
+        if isinstance(event, CallbackQuery):
+            # Кнопка иначе "крутится" до таймаута
+            await event.answer("Слишком часто, подождите немного")
+        return None
@@ -0,0 +1,214 @@
+"""
+Inside PC — раздача web/ из памяти.
+
+Каталог читается при старте; для текстовых файлов заранее готовятся
+gzip и brotli (если установлен пакет brotli) версии, ответ выбирается
+по Accept-Encoding. ETag — хэш содержимого, If-None-Match даёт 304.
+
+У каждого файла есть адрес с хэшем (app.js -> app.<hash>.js), который
+клиент кэширует навсегда; ссылки src/href в HTML на такие файлы
+переписываются при загрузке. Обычный адрес отдаётся с no-cache и
+проверяется по ETag. В dev-режиме каталог перечитывается, как только
+файлы на диске меняются.
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import time
+from dataclasses import dataclass
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from fastapi.responses import Response
+
+log = logging.getLogger("insidepc.static")
+
+_COMPRESSIBLE = ("text/", "application/javascript", "application/json", "application/xml", "image/svg+xml")
+_MIN_COMPRESS = 512
+# src="..." / href="..." без схемы, query и якоря — кандидаты на замену адресом с хэшем
+_REF = re.compile(r"""\b((?:src|href)=["'])([^"':?#]+)(["'])""")
+
+
+@dataclass(slots=True)
+class Asset:
+    media_type: str
+    digest: str
+    hashed: str            # путь с хэшем в имени
+    body: bytes
+    gzip: bytes | None = None
+    br: bytes | None = None
+
+    def variant(self, accepted):
+        """(тело, Content-Encoding) — самое компактное из принятых клиентом."""
+        if self.br is not None and "br" in accepted:
+            return self.br, "br"
+        if self.gzip is not None and "gzip" in accepted:
+            return self.gzip, "gzip"
+        return self.body, None
+
+    def etag(self, encoding=None):
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+
+def _accepted(header):
+    """Кодировки из Accept-Encoding с q > 0."""
+    out = set()
+    for part in header.lower().split(","):
+        name, *params = (s.strip() for s in part.split(";"))
+        q = next((p[2:] for p in params if p.startswith("q=")), "1")
+        try:
+            if float(q) > 0:
+                out.add(name)
+        except ValueError:
+            pass
+    return out
+
+
+def _hashed_name(path, digest):
+    stem, ext = posixpath.splitext(path)
+    return f"{stem}.{digest[:10]}{ext}"
+
+
+class StaticAssets:
+    def __init__(self, root, prefix="/web", dev=False, max_age=365 * 24 * 3600):
+        self.root = root
+        self.prefix = prefix.rstrip("/")
+        self.dev = dev
+        self.max_age = max_age
+        self._assets = {}      # путь -> Asset
+        self._hashed = {}      # путь с хэшем -> Asset
+        self._signature = None
+        self._checked = 0.0
+
+    def _scan(self):
+        """Относительные пути файлов и (mtime, size) — для dev-перезагрузки."""
+        out = {}
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                full = os.path.join(dirpath, name)
+                st = os.stat(full)
+                out[os.path.relpath(full, self.root).replace(os.sep, "/")] = (st.st_mtime_ns, st.st_size)
+        return out
+
+    def _build(self, path, media_type, body):
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        asset = Asset(media_type, digest, _hashed_name(path, digest), body)
+        if len(body) >= _MIN_COMPRESS and media_type.startswith(_COMPRESSIBLE):
+            gz = gzip.compress(body, 9, mtime=0)
+            asset.gzip = gz if len(gz) < len(body) else None
+            if brotli is not None:
+                br = brotli.compress(body, quality=11)
+                asset.br = br if len(br) < len(body) else None
+        return asset
+
+    def _rewrite(self, path, html, assets):
+        """Ссылки HTML на известные файлы -> адреса с хэшем."""
+        base = posixpath.dirname(path)
+
+        def sub(m):
+            ref = m.group(2)
+            if ref.startswith(self.prefix + "/"):
+                target = ref[len(self.prefix) + 1:]
+            elif ref.startswith("/"):
+                return m.group(0)
+            else:
+                target = posixpath.normpath(posixpath.join(base, ref))
+            asset = assets.get(target)
+            if asset is None or asset.media_type == "text/html":
+                return m.group(0)
+            return f"{m.group(1)}{self.prefix}/{asset.hashed}{m.group(3)}"
+        return _REF.sub(sub, html.decode("utf-8")).encode("utf-8")
+
+    def load(self):
+        """(Пере)читает каталог. HTML — последним, после хэшей остальных файлов."""
+        if not os.path.isdir(self.root):
+            log.warning(f"static: нет каталога {self.root}")
+            self._assets, self._hashed, self._signature = {}, {}, {}
+            return
+        signature = self._scan()
+        assets, html = {}, {}
+        for path in signature:
+            media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            with open(os.path.join(self.root, path), "rb") as f:
+                body = f.read()
+            if media_type == "text/html":
+                html[path] = body
+            else:
+                assets[path] = self._build(path, media_type, body)
+        for path, body in html.items():
+            assets[path] = self._build(path, "text/html", self._rewrite(path, body, assets))
+        self._assets = assets
+        self._hashed = {a.hashed: a for a in assets.values()}
+        self._signature = signature
+        log.info(f"static: {len(assets)} файлов из {self.root}")
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked < 1:
+            return
+        self._checked = now
+        if self._scan() != self._signature:
+            self.load()
+
+    def _find(self, path):
+        """(Asset, адрес с хэшем ли) или (None, False)."""
+        path = path.strip("/")
+        for candidate in (path, f"{path}.html", f"{path}/index.html" if path else "index.html"):
+            if candidate in self._assets:
+                return self._assets[candidate], False
+        return self._hashed.get(path), True
+
+    def _refresh(self):
+        if self._signature is None:
+            self.load()
+        elif self.dev:
+            self._reload_if_changed()
+
+    def get(self, path):
+        """Asset по точному пути или None — например, шаблон для серверной отрисовки."""
+        self._refresh()
+        return self._assets.get(path)
+
+    def build(self, path, body, media_type="text/html"):
+        """Asset из готового тела (отрисованный шаблон): со сжатыми версиями и ETag."""
+        return self._build(path, media_type, body)
+
+    def url(self, path):
+        """Адрес с хэшем для шаблонов и клиентского кода."""
+        asset = self._assets.get(path.strip("/"))
+        return f"{self.prefix}/{asset.hashed}" if asset else f"{self.prefix}/{path.strip('/')}"
+
+    def response(self, path, headers):
+        """Response для пути внутри prefix или None, если файла нет."""
+        self._refresh()
+        asset, immutable = self._find(path)
+        return None if asset is None else self.send(asset, headers, immutable)
+
+    def send(self, asset, headers, immutable=False):
+        """Response с Asset: кодировка по Accept-Encoding, 304 по If-None-Match."""
+        body, encoding = asset.variant(_accepted(headers.get("accept-encoding", "")))
+        out = {
+            "ETag": asset.etag(encoding),
+            "Cache-Control": f"public, max-age={self.max_age}, immutable" if immutable else "no-cache",
+        }
+        if asset.gzip is not None or asset.br is not None:
+            out["Vary"] = "Accept-Encoding"
+        tags = {t.strip().removeprefix("W/") for t in headers.get("if-none-match", "").split(",")}
+        if tags & {asset.etag(), asset.etag("gzip"), asset.etag("br")}:
+            return Response(status_code=304, headers=out)
+        if encoding:
+            out["Content-Encoding"] = encoding
+        return Response(body, media_type=asset.media_type, headers=out)
+
+    def stats(self):
+        assets = self._assets.values()
+        return {"files": len(self._assets), "bytes": sum(len(a.body) for a in assets),
+                "gzip_bytes": sum(len(a.gzip) for a in assets if a.gzip),
+                "br_bytes": sum(len(a.br) for a in assets if a.br), "brotli": brotli is not None}
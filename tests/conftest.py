@@ -0,0 +1,41 @@
+"""
+Общие фикстуры: database.py поверх временной БД.
+
+Модуль database держит пул и кэши на уровне модуля — фикстура подменяет
+их свежими, чтобы тесты не делили состояние и не трогали insidepc.db.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """
+    db(body) выполняет async body(database) между init_db() и close_db()
+    в отдельном цикле событий.
+    """
+    pytest.importorskip("aiosqlite")
+    pytest.importorskip("fastapi")
+    import database
+    from cache import TopicIndex, TTLCache
+    from db_pool import Pool
+
+    monkeypatch.setattr(database, "_pool", Pool(str(tmp_path / "db.sqlite"), readers=2, group_window_ms=1))
+    monkeypatch.setattr(database, "_orders", TTLCache(64, 600))
+    monkeypatch.setattr(database, "_users", TTLCache(64, 600))
+    monkeypatch.setattr(database, "_topics", TopicIndex())
+
+    def run(body):
+        async def main():
+            await database.init_db()
+            try:
+                return await body(database)
+            finally:
+                await database.close_db()
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,123 @@
+"""
+Сессии Mini App: подпись initData, токены и разбор заведомо битого ввода.
+
+Любой мусор в заголовках и ?access_token= должен давать AuthError
+(401 / ключ по IP в ratelimit), а не исключение и 500.
+"""
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+from urllib.parse import urlencode
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("fastapi")
+
+from auth import AuthError, Sessions  # noqa: E402
+
+BOT_TOKEN = "123456:TEST"
+
+
+def init_data(user_id=42, auth_date=None, token=BOT_TOKEN, **extra):
+    fields = {"user": json.dumps({"id": user_id, "first_name": "Тест"}),
+              "auth_date": str(int(time.time()) if auth_date is None else auth_date), **extra}
+    check = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    key = hmac.new(b"WebAppData", token.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(key, check.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+def scope(headers=(), query=""):
+    return {"type": "http", "headers": [(k.encode(), v) for k, v in headers],
+            "query_string": query.encode("latin-1")}
+
+
+@pytest.fixture
+def sessions():
+    return Sessions(BOT_TOKEN, ttl=60)
+
+
+def test_init_data_verified_and_cached(sessions):
+    data = init_data()
+    assert sessions.verify_init_data(data)["id"] == 42
+    assert sessions.verify_init_data(data)["id"] == 42
+    assert sessions.stats()["hmac_checks"] == 1
+
+
+@pytest.mark.parametrize("data", [
+    init_data(token="999:OTHER"),
+    init_data().replace("hash=", "hash=0"),
+    init_data()[:-1] + "ü",
+    "hash=%C2%B2&user=%7B%7D&auth_date=1",
+    "user=%7B%22id%22%3A1%7D&auth_date=1",
+    "",
+    "%FF%FE=%FF",
+])
+def test_init_data_rejected(sessions, data):
+    with pytest.raises(AuthError):
+        sessions.verify_init_data(data)
+
+
+def test_init_data_expired(sessions):
+    with pytest.raises(AuthError):
+        sessions.verify_init_data(init_data(auth_date=int(time.time()) - 2 * 24 * 3600))
+
+
+def test_init_data_bad_payload(sessions):
+    with pytest.raises(AuthError):
+        sessions.verify_init_data(init_data(auth_date="²"))
+
+
+def test_token_roundtrip(sessions):
+    token, expires = sessions.issue(42)
+    assert expires > time.time()
+    assert sessions.check(token) == 42
+    assert sessions.user_id(authorization=f"Bearer {token}") == 42
+    assert sessions.user_id(access_token=token) == 42
+
+
+def test_token_expired(sessions):
+    sessions.ttl = -1
+    token, _ = sessions.issue(42)
+    with pytest.raises(AuthError):
+        sessions.check(token)
+
+
+@pytest.mark.parametrize("mangle", [
+    lambda t: t[:-1] + ("A" if t[-1] != "A" else "B"),
+    lambda t: "43" + t[2:],
+    lambda t: t[:-1] + "ü",
+    lambda t: "²" + t[1:],
+    lambda t: t.replace(".", "².", 1),
+    lambda t: "",
+    lambda t: "...",
+    lambda t: "\udcff",
+])
+def test_token_rejected(sessions, mangle):
+    token, _ = sessions.issue(42)
+    with pytest.raises(AuthError):
+        sessions.check(mangle(token))
+
+
+def test_scope_user(sessions):
+    token, _ = sessions.issue(42)
+    assert sessions.scope_user(scope([("authorization", f"Bearer {token}".encode())])) == 42
+    assert sessions.scope_user(scope([("x-telegram-init-data", init_data(7).encode())])) == 7
+    # EventSource / WebSocket: токен только в query string
+    assert sessions.scope_user(scope(query=f"order=1&access_token={token}")) == 42
+    assert sessions.scope_user(scope()) is None
+
+
+@pytest.mark.parametrize("headers,query", [
+    ([("authorization", b"Bearer \xff\xfe.\xb2")], ""),
+    ([("authorization", "Bearer ².1.x".encode())], ""),
+    ([("x-telegram-init-data", b"hash=\xe9&user=%7B%7D&auth_date=1")], ""),
+    ([], "access_token=%C2%B2.%C2%B2.%FF"),
+])
+def test_scope_user_malformed(sessions, headers, query):
+    assert sessions.scope_user(scope(headers, query)) is None
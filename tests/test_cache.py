@@ -0,0 +1,130 @@
+"""
+Кэши: TTL, вытеснение LRU, защита от устаревших строк через epoch и
+индекс топиков. Чтения database.py кладут строку в кэш через set_if —
+запись, случившаяся во время чтения из БД, не должна затираться старой строкой.
+"""
+import time
+
+from cache import TopicIndex, TTLCache
+from models import TopicLink
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    now[0] += 59
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.stats()["misses"] == 1
+
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" становится самым свежим
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_set_if_skips_after_write():
+    cache = TTLCache()
+    epoch = cache.epoch        # читатель пошёл в БД
+    cache.set("k", "new")      # писатель успел обновить строку
+    cache.set_if("k", "old", epoch)
+    assert cache.get("k") == "new"
+
+
+def test_set_if_skips_after_invalidation():
+    cache = TTLCache()
+    epoch = cache.epoch
+    cache.pop("k")
+    cache.set_if("k", "old", epoch)
+    assert cache.get("k") is None
+    epoch = cache.epoch
+    cache.clear()
+    cache.set_if("k", "old", epoch)
+    assert cache.get("k") is None
+
+
+def test_set_if_without_writes():
+    cache = TTLCache()
+    cache.set_if("k", "v", cache.epoch)
+    assert cache.get("k") == "v"
+
+
+def test_topic_index():
+    index = TopicIndex()
+    index.load([TopicLink(10, 1, 100), TopicLink(11, 2, 200)])
+    assert index.by_order(1).topic_id == 10
+    assert index.by_topic(11).order_id == 2
+    # Топик перепривязан к другому заказу: старый заказ его больше не видит
+    index.put(TopicLink(10, 3, 100))
+    assert index.by_order(1) is None
+    assert index.by_order(3).topic_id == 10
+    assert index.by_topic(99) is None and index.by_order(99) is None
+    index.load([])
+    assert len(index) == 0 and index.by_order(3) is None
+
+
+def _write_during_read(database, monkeypatch, write):
+    """fetchone, который перед возвратом строки выполняет запись в БД."""
+    fetchone = database._pool.fetchone
+
+    async def slow(*args, **kwargs):
+        row = await fetchone(*args, **kwargs)
+        monkeypatch.setattr(database._pool, "fetchone", fetchone)
+        await write()
+        return row
+    monkeypatch.setattr(database._pool, "fetchone", slow)
+
+
+def test_get_order_write_during_read(db, monkeypatch):
+    async def body(database):
+        order = await database.create_order_returning(1, "build", False, None, "", 10, 280)
+        database._orders.pop(order.id)
+        _write_during_read(database, monkeypatch,
+                           lambda: database.update_status_returning(order.id, "completed"))
+        stale = await database.get_order(order.id)
+        return stale, database._orders.get(order.id), await database.get_order(order.id)
+
+    stale, cached, fresh = db(body)
+    assert stale.status == "pending_payment"  # само чтение видит старое
+    assert cached.status == "completed"       # но в кэш не попало
+    assert fresh.status == "completed"
+
+
+def test_get_user_write_during_read(db, monkeypatch):
+    async def body(database):
+        await database.upsert_user(1, "old", "Old Name")
+        database._users.pop(1)
+        _write_during_read(database, monkeypatch, lambda: database.upsert_user(1, "new", "New Name"))
+        await database.get_user(1)
+        return await database.get_user(1)
+
+    assert db(body).username == "new"
+
+
+def test_get_order_with_user_write_during_read(db, monkeypatch):
+    async def body(database):
+        await database.upsert_user(1, "old", "Old Name")
+        order = await database.create_order_returning(1, "build", False, None, "", 10, 280)
+        database._orders.pop(order.id)
+        database._users.pop(1)
+
+        async def write():
+            await database.update_status_returning(order.id, "in_progress")
+            await database.upsert_user(1, "new", "New Name")
+        _write_during_read(database, monkeypatch, write)
+        await database.get_order_with_user(order.id)
+        return await database.get_order_with_user(order.id)
+
+    order, user = db(body)
+    assert order.status == "in_progress"
+    assert user.username == "new"
@@ -0,0 +1,119 @@
+"""
+Idempotency-Key: повтор отдаёт сохранённый ответ, другое тело с тем же
+ключом — IdempotencyMismatch, истёкший ключ обрабатывается заново.
+"""
+import asyncio
+
+import pytest
+
+from idempotency import Idempotency, IdempotencyMismatch
+
+
+class Store:
+    """load/save в памяти с тем же контрактом, что у database."""
+
+    def __init__(self):
+        self.rows = {}
+
+    async def load(self, key):
+        return self.rows.get(key)
+
+    async def save(self, key, fp, response, ttl):
+        self.rows[key] = (fp, response)
+
+
+def make(calls):
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0)
+        return {"id": len(calls)}
+    return handler
+
+
+def test_replay_returns_stored_response():
+    async def main():
+        calls, store = [], Store()
+        idem = Idempotency(store.load, store.save)
+        first = await idem.run("u1:k", {"a": 1}, make(calls))
+        second = await idem.run("u1:k", {"a": 1}, make(calls))
+        return calls, first, second, idem.replays
+
+    calls, first, second, replays = asyncio.run(main())
+    assert first == ({"id": 1}, False)
+    assert second == ({"id": 1}, True)
+    assert len(calls) == 1 and replays == 1
+
+
+def test_concurrent_duplicates_run_once():
+    async def main():
+        calls, store = [], Store()
+        idem = Idempotency(store.load, store.save)
+        return calls, await asyncio.gather(*(idem.run("u1:k", {"a": 1}, make(calls)) for _ in range(5)))
+
+    calls, results = asyncio.run(main())
+    assert len(calls) == 1
+    assert {r[0]["id"] for r in results} == {1}
+    assert sorted(r[1] for r in results) == [False, True, True, True, True]
+
+
+def test_mismatch_stored_and_inflight():
+    async def main():
+        calls, store = [], Store()
+        idem = Idempotency(store.load, store.save)
+        await idem.run("u1:k", {"a": 1}, make(calls))
+        with pytest.raises(IdempotencyMismatch):
+            await idem.run("u1:k", {"a": 2}, make(calls))
+
+        # Тот же ключ с другим телом, пока первый запрос ещё выполняется
+        first = asyncio.ensure_future(idem.run("u1:k2", {"a": 1}, make(calls)))
+        await asyncio.sleep(0)
+        with pytest.raises(IdempotencyMismatch):
+            await idem.run("u1:k2", {"a": 2}, make(calls))
+        await first
+        return calls
+
+    assert len(asyncio.run(main())) == 2
+
+
+def test_handler_error_not_stored():
+    async def main():
+        store = Store()
+        idem = Idempotency(store.load, store.save)
+
+        async def fail():
+            raise RuntimeError("boom")
+        with pytest.raises(RuntimeError):
+            await idem.run("u1:k", {"a": 1}, fail)
+        return await idem.run("u1:k", {"a": 1}, make([]))
+
+    assert asyncio.run(main()) == ({"id": 1}, False)
+
+
+def test_stored_key_expires(db):
+    async def body(database):
+        await database.save_idempotent("u1:live", "fp", {"id": 1}, 60)
+        await database.save_idempotent("u1:old", "fp", {"id": 2}, -1)
+        return await database.load_idempotent("u1:live"), await database.load_idempotent("u1:old")
+
+    live, old = db(body)
+    assert live == ("fp", {"id": 1})
+    assert old is None
+
+
+def test_expired_key_runs_again(db):
+    async def body(database):
+        calls = []
+        idem = Idempotency(database.load_idempotent, database.save_idempotent, ttl=-1)
+        first = await idem.run("u1:k", {"a": 1}, make(calls))
+        second = await idem.run("u1:k", {"a": 1}, make(calls))
+        # С живым TTL тот же сценарий — повтор из БД
+        idem.ttl = 60
+        third = await idem.run("u1:k2", {"a": 1}, make(calls))
+        fourth = await idem.run("u1:k2", {"a": 1}, make(calls))
+        return first, second, third, fourth
+
+    first, second, third, fourth = db(body)
+    assert first == ({"id": 1}, False)
+    assert second == ({"id": 2}, False)
+    assert third == ({"id": 3}, False)
+    assert fourth == ({"id": 3}, True)
@@ -0,0 +1,59 @@
+"""
+MediaCache: производные версии (WebP из thumbs) входят в лимит размера
+и удаляются вместе с оригиналом; симлинки by-id не остаются висячими.
+"""
+import os
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from media import MediaCache  # noqa: E402
+
+
+def _put(root, name, size, mtime, derived=()):
+    path = os.path.join(root, "objects", name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    os.utime(path, (mtime, mtime))
+    for i, dsize in enumerate(derived):
+        d = os.path.join(root, "derived", name)
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, f"{i}.webp"), "wb") as f:
+            f.write(b"w" * dsize)
+    return path
+
+
+def _cache(root, max_bytes):
+    for d in ("objects", "by-id", "tmp", "derived"):
+        os.makedirs(os.path.join(root, d), exist_ok=True)
+    return MediaCache(str(root), resolver=None, max_bytes=max_bytes)
+
+
+def test_scan_counts_derived_and_drops_orphans(tmp_path):
+    _cache(tmp_path, 10_000)
+    _put(tmp_path, "a.jpg", 1000, 1, derived=(300, 200))
+    os.makedirs(tmp_path / "derived" / "gone.jpg")
+    os.symlink("../objects/gone.jpg", tmp_path / "by-id" / "dangling")
+    cache = _cache(tmp_path, 10_000)
+    assert cache.stats()["bytes"] == 1500
+    assert not (tmp_path / "derived" / "gone.jpg").exists()
+    assert not os.path.lexists(tmp_path / "by-id" / "dangling")
+
+
+def test_add_derived_evicts_with_source(tmp_path):
+    _cache(tmp_path, 10_000)
+    old = _put(tmp_path, "old.jpg", 1000, 1, derived=(400,))
+    new = _put(tmp_path, "new.jpg", 1000, 2)
+    cache = _cache(tmp_path, 2600)
+    assert cache.stats()["bytes"] == 2400
+    # thumbs дописал версии для new.jpg: лимит превышен, уходит old.jpg целиком
+    os.makedirs(cache.derived_dir(new))
+    with open(os.path.join(cache.derived_dir(new), "320.webp"), "wb") as f:
+        f.write(b"w" * 500)
+    cache.add_derived(new)
+    stats = cache.stats()
+    assert (stats["objects"], stats["bytes"]) == (1, 1500)
+    assert not os.path.exists(old)
+    assert not os.path.exists(cache.derived_dir(old))
+    assert os.path.exists(new)
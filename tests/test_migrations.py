@@ -0,0 +1,115 @@
+"""
+Миграции схемы: версия, параллельный запуск и планы горячих запросов.
+
+Планы проверяются через EXPLAIN QUERY PLAN: запрос должен идти по
+индексу и не сортировать во временном B-дереве (USE TEMP B-TREE).
+
+    python -m pytest -q tests
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+aiosqlite = pytest.importorskip("aiosqlite")
+
+from migrations import MIGRATIONS, migrate  # noqa: E402
+from models import Order, OrderSummary, PortfolioItem  # noqa: E402
+
+LATEST = MIGRATIONS[-1][0]
+
+# Запросы приложения: куски SQL дословно как в исходнике (f-строки с
+# {Model.COLUMNS}), параметры и индексы, которые должен выбрать план.
+# test_query_in_source не даёт кускам разойтись с кодом.
+PLANS = {
+    "get_user_orders": ("database.py", [
+        "SELECT {OrderSummary.COLUMNS} FROM orders WHERE user_id=?",
+        " ORDER BY created_at DESC, id DESC LIMIT ?",
+    ], (1, 11), ["idx_orders_user_created_id"]),
+    "get_user_orders (before)": ("database.py", [
+        "SELECT {OrderSummary.COLUMNS} FROM orders WHERE user_id=?",
+        " AND (created_at, id) < (SELECT created_at, id FROM orders WHERE id=?)",
+        " ORDER BY created_at DESC, id DESC LIMIT ?",
+    ], (1, 5, 11), ["idx_orders_user_created_id"]),
+    "get_user_order_counts": ("database.py", [
+        "SELECT status, COUNT(*) FROM orders WHERE user_id=? GROUP BY status",
+    ], (1,), ["idx_orders_user_status_created"]),
+    "get_order": ("database.py", [
+        "SELECT {Order.COLUMNS} FROM orders WHERE id=?",
+    ], (1,), ["INTEGER PRIMARY KEY"]),
+    "get_latest_pending_order": ("database (1).py", [
+        "SELECT {Order.COLUMNS} FROM orders WHERE user_id=? AND status='pending_payment' ",
+        "ORDER BY created_at DESC LIMIT 1",
+    ], (1,), ["idx_orders_user_status_created"]),
+    "get_portfolio_all": ("database (1).py", [
+        "SELECT {PortfolioItem.COLUMNS} FROM portfolio_items WHERE is_visible=1 ORDER BY created_at DESC",
+    ], (), ["idx_portfolio_visible_created", "idx_portfolio_photos_item"]),
+    "get_portfolio_item": ("database (1).py", [
+        "SELECT {PortfolioItem.COLUMNS} FROM portfolio_items WHERE id=?",
+    ], (1,), ["INTEGER PRIMARY KEY", "idx_portfolio_photos_item"]),
+    "remove_portfolio_photo": ("database (1).py", [
+        "SELECT id FROM portfolio_photos WHERE item_id=? ORDER BY position LIMIT 1 OFFSET ?",
+    ], (1, 0), ["idx_portfolio_photos_item"]),
+}
+
+
+def plan_sql(pieces):
+    return "".join(pieces).format(Order=Order, OrderSummary=OrderSummary, PortfolioItem=PortfolioItem)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _migrated(path):
+    async with aiosqlite.connect(path) as db:
+        version = await migrate(db)
+        cur = await db.execute("SELECT version FROM schema_version ORDER BY version")
+        return version, [r[0] for r in await cur.fetchall()]
+
+
+async def _plan(path, sql, params):
+    async with aiosqlite.connect(path) as db:
+        await migrate(db)
+        cur = await db.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [r[-1] for r in await cur.fetchall()]
+
+
+def test_migrate_fresh_and_repeat(tmp_path):
+    path = str(tmp_path / "db.sqlite")
+    assert run(_migrated(path)) == (LATEST, list(range(1, LATEST + 1)))
+    # Повторный запуск ничего не применяет
+    assert run(_migrated(path)) == (LATEST, list(range(1, LATEST + 1)))
+
+
+def test_migrate_concurrent(tmp_path):
+    path = str(tmp_path / "db.sqlite")
+
+    async def both():
+        return await asyncio.gather(_migrated(path), _migrated(path))
+
+    for version, versions in run(both()):
+        assert version == LATEST
+        assert versions == list(range(1, LATEST + 1))
+
+
+@pytest.mark.parametrize("name", PLANS)
+def test_query_in_source(name):
+    source, pieces, _, _ = PLANS[name]
+    with open(os.path.join(ROOT, source), encoding="utf-8") as f:
+        text = f.read()
+    for piece in pieces:
+        assert piece in text, f"{source}: запрос {name} изменился — обновите PLANS"
+
+
+@pytest.mark.parametrize("name", PLANS)
+def test_query_plan_uses_index(tmp_path, name):
+    _, pieces, params, indexes = PLANS[name]
+    plan = run(_plan(str(tmp_path / "db.sqlite"), plan_sql(pieces), params))
+    for index in indexes:
+        assert any(index in step for step in plan), plan
+    assert not any("TEMP B-TREE" in step for step in plan), plan
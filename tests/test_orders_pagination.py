@@ -0,0 +1,72 @@
+"""
+Keyset-пагинация истории заказов (get_user_orders): обход всех страниц
+без дублей и пропусков, в том числе при одинаковом created_at.
+"""
+import pytest
+
+# Несколько заказов на одну секунду — сравнение (created_at, id) должно
+# развести их по id
+STAMPS = ["2026-01-01 10:00:00"] * 4 + ["2026-01-02 10:00:00"] * 3 + ["2026-01-03 10:00:00"] * 5
+
+
+async def _seed(database):
+    ids = []
+    for stamp in STAMPS:
+        order = await database.create_order_returning(1, "build", False, None, "", 10, 280)
+        await database.create_order_returning(2, "build", False, None, "", 10, 280)  # чужие заказы
+
+        async def op(db, oid=order.id, stamp=stamp):
+            await db.execute("UPDATE orders SET created_at=? WHERE id=?", (stamp, oid))
+        await database._pool.write(op)
+        ids.append((stamp, order.id))
+    # Ожидаемый порядок истории: новые сверху, при равном времени — больший id
+    return [oid for _, oid in sorted(ids, reverse=True)]
+
+
+async def _walk(database, limit):
+    pages, before = [], None
+    while True:
+        orders, before = await database.get_user_orders(1, limit, before)
+        pages.append([o.id for o in orders])
+        if before is None:
+            return pages
+
+
+@pytest.mark.parametrize("limit", [1, 3, 4, 5, 11, 12, 13, 50])
+def test_walk_all_pages(db, limit):
+    async def body(database):
+        return await _seed(database), await _walk(database, limit)
+
+    expected, pages = db(body)
+    seen = [oid for page in pages for oid in page]
+    assert seen == expected                      # нет дублей, пропусков и чужих заказов
+    assert all(len(page) == limit for page in pages[:-1])
+    assert 0 < len(pages[-1]) <= limit           # последняя страница не пустая
+
+
+def test_cursor_is_last_item(db):
+    async def body(database):
+        expected = await _seed(database)
+        orders, cursor = await database.get_user_orders(1, 4)
+        return expected, [o.id for o in orders], cursor
+
+    expected, first, cursor = db(body)
+    assert first == expected[:4]
+    assert cursor == first[-1]
+
+
+def test_exact_fit_has_no_next_page(db):
+    async def body(database):
+        await _seed(database)
+        return await database.get_user_orders(1, len(STAMPS))
+
+    orders, cursor = db(body)
+    assert len(orders) == len(STAMPS)
+    assert cursor is None
+
+
+def test_empty_history(db):
+    async def body(database):
+        return await database.get_user_orders(1, 10)
+
+    assert db(body) == ([], None)
@@ -0,0 +1,151 @@
+"""
+Token bucket и RateLimitMiddleware: пополнение ведра, 429 с Retry-After
+и тело запроса, которое после _peek_json доходит до приложения целиком.
+"""
+import asyncio
+import json
+import time
+
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("fastapi")
+
+from ratelimit import Limiter, RateLimitMiddleware, RateLimits, _peek_json  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_refill(clock):
+    limiter = Limiter(rate=1, burst=2)
+    assert limiter.hit("u1") == 0
+    assert limiter.hit("u1") == 0
+    assert limiter.hit("u1") == pytest.approx(1)   # пусто: ждать секунду
+    assert limiter.hit("u2") == 0                   # у другого ключа своё ведро
+    clock[0] += 0.5
+    assert limiter.hit("u1") == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert limiter.hit("u1") == 0
+    clock[0] += 100                                 # больше burst не копится
+    assert [limiter.hit("u1") for _ in range(3)][:2] == [0, 0]
+    assert limiter.rejected == 3
+
+
+def test_sweep_drops_full_buckets(clock):
+    limiter = Limiter(rate=0.1, burst=1, sweep_every=10)   # полное через 10 с
+    limiter.hit("a")
+    clock[0] += 5
+    limiter.hit("b")
+    clock[0] += 6   # "a" уже полное, "b" ещё нет
+    limiter.hit("c")
+    assert sorted(limiter._buckets) == ["b", "c"]
+
+
+def test_acquire_waits_for_tokens():
+    async def main():
+        limiter = Limiter(rate=50, burst=1)
+        start = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(main()) >= 2 / 50 * 0.9
+
+
+def _receive(chunks):
+    messages = [{"type": "http.request", "body": c, "more_body": i < len(chunks) - 1}
+                for i, c in enumerate(chunks)]
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+    return receive
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        msg = await receive()
+        body += msg.get("body", b"")
+        if not msg.get("more_body"):
+            return body
+
+
+@pytest.mark.parametrize("chunks", [
+    [b'{"user_id": 7, "service_type": "build"}'],
+    [b'{"user_id": ', b'7, "description": "', "ё".encode() * 10, b'"}'],
+    [b"not json"],
+    [b""],
+    [b"x" * 40_000, b"y" * 40_000, b"z" * 100],   # больше лимита просмотра
+])
+def test_peek_json_replays_body(chunks):
+    async def main():
+        data, receive = await _peek_json(_receive(chunks))
+        return data, await _read_body(receive)
+
+    data, body = asyncio.run(main())
+    assert body == b"".join(chunks)
+    if chunks[0].startswith(b"{"):
+        assert data["user_id"] == 7
+
+
+class App:
+    """ASGI-приложение: читает тело целиком и отвечает 200."""
+
+    def __init__(self):
+        self.bodies = []
+
+    async def __call__(self, scope, receive, send):
+        self.bodies.append(await _read_body(receive))
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+
+def _request(middleware, body, path="/api/order", headers=()):
+    scope = {"type": "http", "method": "POST", "path": path, "query_string": b"",
+             "headers": [(b"content-type", b"application/json"), *headers], "client": ("10.0.0.1", 1)}
+    sent = []
+
+    async def send(msg):
+        sent.append(msg)
+    asyncio.run(middleware(scope, _receive([body]), send))
+    return sent[0]
+
+
+def test_middleware_429_when_bucket_empty(clock):
+    app = App()
+    mw = RateLimitMiddleware(app, RateLimits({"POST /api/order": (1 / 10, 2)}))
+    body = json.dumps({"user_id": 7, "service_type": "build"}).encode()
+    statuses = [_request(mw, body)["status"] for _ in range(2)]
+    rejected = _request(mw, body)
+    assert statuses == [200, 200]
+    assert rejected["status"] == 429
+    assert dict(rejected["headers"])[b"retry-after"] == b"10"
+    assert app.bodies == [body, body]   # до приложения дошло без изменений, отказ — без вызова
+    # Другой пользователь не затронут; через 10 с токен вернулся
+    assert _request(mw, json.dumps({"user_id": 8}).encode())["status"] == 200
+    clock[0] += 10
+    assert _request(mw, body)["status"] == 200
+
+
+def test_middleware_identify_overrides_body(clock):
+    app = App()
+    mw = RateLimitMiddleware(app, RateLimits({"POST /api/order": (1 / 10, 1)}),
+                             identify=lambda scope: 42 if dict(scope["headers"]).get(b"authorization") else None)
+    auth = [(b"authorization", b"Bearer t")]
+    assert _request(mw, b'{"user_id": 1}', headers=auth)["status"] == 200
+    # Заявленный в теле user_id не даёт нового ведра
+    assert _request(mw, b'{"user_id": 2}', headers=auth)["status"] == 429
+    # Без сессии — ключ по IP
+    assert _request(mw, b'{"user_id": 3}')["status"] == 200
+    assert _request(mw, b'{"user_id": 4}')["status"] == 429
+
+
+def test_unmatched_path_passes(clock):
+    app = App()
+    mw = RateLimitMiddleware(app, RateLimits({"POST /api/order": (1 / 10, 1)}))
+    assert all(_request(mw, b"{}", path="/web/app.js")["status"] == 200 for _ in range(5))
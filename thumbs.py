@@ -0,0 +1,111 @@
+"""
+Inside PC — уменьшенные копии фото портфолио.
+
+Из закэшированного оригинала (media.MediaCache) делаются WebP-версии
+нескольких ширин для srcset. Pillow — необязательная зависимость:
+без неё отдаётся оригинал. Кодирование идёт в пуле процессов, чтобы
+не блокировать event loop.
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+log = logging.getLogger("insidepc.media")
+
+
+def _render(src, out_dir, widths, quality):
+    """Выполняется в отдельном процессе. Пишет <out_dir>/<w>.webp."""
+    os.makedirs(out_dir, exist_ok=True)
+    with Image.open(src) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGB")
+        for w in widths:
+            dst = os.path.join(out_dir, f"{w}.webp")
+            if os.path.exists(dst):
+                continue
+            copy = img.copy()
+            # Не увеличиваем: узкий оригинал просто перекодируется в WebP
+            copy.thumbnail((min(w, img.width), img.height))
+            tmp = f"{dst}.{os.getpid()}.tmp"
+            copy.save(tmp, "WEBP", quality=quality, method=4)
+            os.replace(tmp, dst)
+
+
+class Thumbnailer:
+    def __init__(self, media, widths=(320, 640, 1280), quality=80, workers=2):
+        self.media = media
+        self.widths = tuple(sorted(widths))
+        self.quality = quality
+        self.workers = workers
+        self._pool = None
+        self._inflight = {}
+        self.renders = 0
+
+    @property
+    def enabled(self):
+        return Image is not None
+
+    def srcset(self, file_id):
+        """{"src", "srcset"} для <img>; без Pillow — только оригинал."""
+        src = f"/media/{file_id}"
+        if not self.enabled:
+            return {"src": src, "srcset": ""}
+        return {
+            "src": f"{src}/{self.widths[-1]}",
+            "srcset": ", ".join(f"{src}/{w} {w}w" for w in self.widths),
+        }
+
+    async def _render_all(self, original):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        out_dir = self.media.derived_dir(original)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._pool, _render, original, out_dir, self.widths, self.quality)
+        except Exception as e:
+            log.warning(f"thumbs {original}: {e}")
+            return None
+        self.renders += 1
+        # WebP-версии занимают место в кэше наравне с оригиналом
+        self.media.add_derived(original)
+        return out_dir
+
+    async def _ensure(self, original):
+        out_dir = self.media.derived_dir(original)
+        if all(os.path.exists(os.path.join(out_dir, f"{w}.webp")) for w in self.widths):
+            return out_dir
+        task = self._inflight.get(original)
+        if task is None:
+            task = asyncio.ensure_future(self._render_all(original))
+            self._inflight[original] = task
+            task.add_done_callback(lambda _: self._inflight.pop(original, None))
+        return await asyncio.shield(task)
+
+    async def get(self, file_id, width):
+        """Путь к версии нужной ширины; без Pillow или при ошибке — оригинал."""
+        original = await self.media.get(file_id)
+        if not original or not self.enabled or width not in self.widths:
+            return original
+        out_dir = await self._ensure(original)
+        return os.path.join(out_dir, f"{width}.webp") if out_dir else original
+
+    async def warm(self, file_id):
+        """Скачивает оригинал и готовит все размеры заранее."""
+        try:
+            original = await self.media.get(file_id)
+            if original and self.enabled:
+                await self._ensure(original)
+        except Exception as e:
+            log.warning(f"thumbs warm {file_id}: {e}")
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None